@@ -0,0 +1,145 @@
+import os
+import json
+import math
+import pandas as pd
+from ib_statement_reader import write_json_atomic
+
+SUMMARY_COLUMNS = ['Stocks_Realized', 'Options_Realized', 'Forex_Realized', 'Total_Realized']
+
+
+def _amount(value):
+    # None for amounts that could not be converted (NaN); they are counted, never summed
+    value = float(value or 0)
+    return None if math.isnan(value) else value
+
+
+def _total(total, missing):
+    return float('nan') if missing else total
+
+
+def _sort_key(key):
+    # Years/months are ints, or 'Unknown' when the period could not be parsed
+    return tuple((isinstance(part, str), part) for part in key)
+
+
+class AggregateStore:
+    """Persistent Summary_by_Year / Monthly_Summary rollups, updated per statement"""
+
+    def __init__(self, path="IB_PnL_Aggregates.json"):
+        self.path = path
+        # File -> [[account, year, month, [values]], ...] as last applied (None for unconverted amounts)
+        self.statements = {}
+        # (account, year) -> [row_count, *SUMMARY_COLUMNS sums, *SUMMARY_COLUMNS unconverted counts]
+        self.yearly = {}
+        # (year, month, account) -> [row_count, Total_Realized sum, unconverted count]
+        self.monthly = {}
+        self.load()
+
+    def load(self):
+        """Load a previously saved store (no-op if none exists)"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                saved = json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"Error reading aggregate store {self.path}: {e}")
+            return
+
+        self.statements = saved.get('statements', {})
+        self.yearly = {tuple(cell[0]): cell[1] for cell in saved.get('yearly', [])}
+        self.monthly = {tuple(cell[0]): cell[1] for cell in saved.get('monthly', [])}
+        print(f"Loaded aggregates for {len(self.statements)} statements from {self.path}")
+
+    def save(self):
+        """Write the store atomically"""
+        if not self.path:
+            return
+        saved = {
+            'statements': self.statements,
+            'yearly': [[list(key), cell] for key, cell in self.yearly.items()],
+            'monthly': [[list(key), cell] for key, cell in self.monthly.items()],
+        }
+        write_json_atomic(self.path, saved)
+
+    def _apply(self, contributions, sign):
+        columns = len(SUMMARY_COLUMNS)
+        for account, year, month, values in contributions:
+            yearly_cell = self.yearly.setdefault((account, year), [0] + [0.0] * columns + [0] * columns)
+            yearly_cell[0] += sign
+            for i, value in enumerate(values):
+                if value is None:
+                    yearly_cell[1 + columns + i] += sign
+                else:
+                    yearly_cell[i + 1] += sign * value
+            if yearly_cell[0] <= 0:
+                del self.yearly[(account, year)]
+
+            monthly_cell = self.monthly.setdefault((year, month, account), [0, 0.0, 0])
+            monthly_cell[0] += sign
+            if values[-1] is None:
+                monthly_cell[2] += sign
+            else:
+                monthly_cell[1] += sign * values[-1]
+            if monthly_cell[0] <= 0:
+                del self.monthly[(year, month, account)]
+
+    def replace_statement(self, file_name, rows):
+        """Swap one statement's contribution; only its (account, year, month) cells change"""
+        self.remove_statement(file_name)
+        contributions = []
+        for row in rows:
+            values = [_amount(row.get(column)) for column in SUMMARY_COLUMNS]
+            contributions.append([row['Account'], row['Year'], row['Month'], values])
+        self._apply(contributions, 1)
+        self.statements[file_name] = contributions
+
+    def remove_statement(self, file_name):
+        """Drop a statement's contribution if it was applied before"""
+        contributions = self.statements.pop(file_name, None)
+        if contributions:
+            self._apply(contributions, -1)
+
+    def update_from_rows(self, rows, statement_keys=None):
+        """Replace every statement that appears in rows
+
+        statement_keys, one per row, names the statement each row belongs to
+        (default: its File).
+        """
+        if statement_keys is None:
+            statement_keys = [row['File'] for row in rows]
+        by_file = {}
+        for row, file_name in zip(rows, statement_keys):
+            by_file.setdefault(file_name, []).append(row)
+        for file_name, file_rows in by_file.items():
+            self.replace_statement(file_name, file_rows)
+        return list(by_file)
+
+    def summary_by_year(self):
+        """Summary_by_Year served from the stored cells (NaN where any amount was unconverted)"""
+        columns = len(SUMMARY_COLUMNS)
+        records = []
+        for key in sorted(self.yearly, key=_sort_key):
+            account, year = key
+            cell = self.yearly[key]
+            record = {'Account': account, 'Year': year}
+            record.update(zip(SUMMARY_COLUMNS, map(_total, cell[1:1 + columns], cell[1 + columns:])))
+            records.append(record)
+        return pd.DataFrame(records, columns=['Account', 'Year'] + SUMMARY_COLUMNS)
+
+    def monthly_summary(self):
+        """Monthly_Summary (Year, Month x Account totals) served from the stored cells"""
+        accounts = sorted({key[2] for key in self.monthly})
+        periods = {}
+        for (year, month, account), cell in self.monthly.items():
+            periods.setdefault((year, month), {})[account] = _total(cell[1], cell[2])
+
+        records = []
+        for year, month in sorted(periods, key=_sort_key):
+            record = {'Year': year, 'Month': month}
+            record.update(periods[(year, month)])
+            records.append(record)
+
+        monthly_summary = pd.DataFrame(records, columns=['Year', 'Month'] + accounts)
+        monthly_summary.columns.name = 'Account'
+        return monthly_summary
@@ -0,0 +1,170 @@
+import os
+import sys
+import json
+import pandas as pd
+from ib_statement_reader import read_statement_file, html_paths, write_json_atomic
+from ib_fragment_cache import section_rows
+
+# Contract Info header name -> catalog field; the layout varies by asset class and year
+CONTRACT_FIELDS = {
+    'Symbol': 'Symbol',
+    'Description': 'Description',
+    'Conid': 'Conid',
+    'Security ID': 'Security_Id',
+    'Listing Exch': 'Exchange',
+    'Multiplier': 'Multiplier',
+    'Expiry': 'Expiry',
+    'Delivery Month': 'Delivery_Month',
+    'Type': 'Type',
+    'Strike': 'Strike',
+    'Code': 'Code',
+}
+CATALOG_COLUMNS = ['Symbol_Id', 'Asset_Class'] + list(CONTRACT_FIELDS.values())
+
+
+def extract_contracts(statement):
+    """Contract records from every tblContractInfo<account>Body section of a statement"""
+    contracts = []
+    for section_id in statement.sections():
+        if not (section_id.startswith('tblContractInfo') and section_id.endswith('Body')):
+            continue
+
+        fields = []
+        asset_class = None
+        for is_header, values in section_rows(statement, section_id):
+            if is_header:
+                fields = [CONTRACT_FIELDS.get(value) for value in values]
+                continue
+
+            if len(values) == 1:
+                if values[0]:
+                    asset_class = values[0]
+                continue
+            if not fields or len(values) < len(fields):
+                continue
+
+            contract = {'Asset_Class': asset_class}
+            for field, value in zip(fields, values):
+                if field and value:
+                    contract[field] = value
+            if contract.get('Symbol'):
+                contracts.append(contract)
+    return contracts
+
+
+class ContractCatalog:
+    """Deduplicated contract dimension table shared by all processed statements
+
+    Each distinct contract (by IB conid, or asset class, symbol and
+    description when there is none) gets a small integer Symbol_Id, resolved
+    through a dict lookup, so repeated contracts are never stored twice.
+    The catalog is saved as JSON and reloaded on the next run.
+    """
+
+    def __init__(self, path="IB_Contracts.json"):
+        self.path = path
+        self.contracts = []
+        self.sources = set()
+        self._ids = {}
+        self._symbol_ids = {}
+        self.load()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                stored = json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"Error reading contract catalog {self.path}: {e}")
+            return
+        self.contracts = []
+        self._ids = {}
+        self._symbol_ids = {}
+        for contract in stored.get('contracts', []):
+            self._store(contract)
+        self.sources = set(stored.get('sources', []))
+
+    def save(self):
+        if not self.path:
+            return
+        stored = {'contracts': self.contracts, 'sources': sorted(self.sources)}
+        write_json_atomic(self.path, stored)
+
+    def __len__(self):
+        return len(self.contracts)
+
+    @staticmethod
+    def contract_key(contract):
+        if contract.get('Conid'):
+            return contract['Conid']
+        return (contract.get('Asset_Class'), contract['Symbol'], contract.get('Description'))
+
+    def _store(self, contract):
+        # Interned strings: the same exchange, type or asset class is held once in memory
+        contract = {field: sys.intern(value) if isinstance(value, str) else value
+                    for field, value in contract.items()}
+        symbol_id = len(self.contracts)
+        self.contracts.append(contract)
+        self._ids[self.contract_key(contract)] = symbol_id
+        # Trade tables name options by their description rather than the local symbol
+        for name in (contract['Symbol'], contract.get('Description')):
+            if name:
+                self._symbol_ids.setdefault((contract.get('Asset_Class'), name), symbol_id)
+                self._symbol_ids.setdefault((None, name), symbol_id)
+        return symbol_id
+
+    def intern(self, contract):
+        """Symbol_Id of a contract record, adding it if it is new"""
+        symbol_id = self._ids.get(self.contract_key(contract))
+        if symbol_id is None:
+            return self._store(contract)
+        # A later statement may carry fields an older layout lacked
+        stored = self.contracts[symbol_id]
+        for field, value in contract.items():
+            if value and not stored.get(field):
+                stored[field] = sys.intern(value) if isinstance(value, str) else value
+        return symbol_id
+
+    def add_statement(self, statement):
+        file_hash = statement.sha256()
+        if file_hash in self.sources:
+            return 0
+        before = len(self.contracts)
+        for contract in extract_contracts(statement):
+            self.intern(contract)
+        self.sources.add(file_hash)
+        added = len(self.contracts) - before
+        print(f"Catalogued {added} new contracts from {statement.name}")
+        return added
+
+    def add_file(self, file_path):
+        """Catalog the contracts of one HTML statement (skipped if already seen)"""
+        return read_statement_file(file_path, self.add_statement, 0)
+
+    def add_files(self, file_paths):
+        added = sum(self.add_file(path) for path in html_paths(file_paths))
+        self.save()
+        return added
+
+    def symbol_id(self, symbol, asset_class=None):
+        """Symbol_Id for a traded symbol or contract description (None if not catalogued)"""
+        symbol_id = self._symbol_ids.get((asset_class, symbol))
+        if symbol_id is None and asset_class is not None:
+            symbol_id = self._symbol_ids.get((None, symbol))
+        return symbol_id
+
+    def encode(self, df, symbol_column='Symbol', asset_class_column='Asset_Class', drop_symbol=False):
+        """Add an integer Symbol_Id column to trade or position rows (-1 where unknown)"""
+        df = df.copy()
+        asset_classes = df[asset_class_column] if asset_class_column in df.columns else [None] * len(df)
+        ids = [self.symbol_id(symbol, asset_class) for symbol, asset_class in zip(df[symbol_column], asset_classes)]
+        df['Symbol_Id'] = pd.array([-1 if symbol_id is None else symbol_id for symbol_id in ids], dtype='int32')
+        if drop_symbol:
+            df = df.drop(columns=[symbol_column])
+        return df
+
+    def to_frame(self):
+        """The catalog as a dimension table indexed by Symbol_Id order"""
+        records = [dict(contract, Symbol_Id=symbol_id) for symbol_id, contract in enumerate(self.contracts)]
+        return pd.DataFrame(records, columns=CATALOG_COLUMNS)
@@ -3,22 +3,51 @@ import pandas as pd
 import PyPDF2
 from datetime import datetime
 import os
-import glob
+import gc
+import sys
+import csv
+import json
+import asyncio
+import argparse
+import contextlib
+import inspect
+from concurrent.futures import ProcessPoolExecutor
 from bs4 import BeautifulSoup
+try:
+    import resource
+except ImportError:
+    resource = None
+from ib_statement_reader import StatementBuffer, is_archive, iter_archive_members
+from ib_statement_index import StatementIndex, plan_sources
+from ib_run_journal import RunJournal
+from ib_pdf_text import scan_statement_text, PERIOD_HEADINGS
+from ib_partitions import PartitionManifest, PARTITION_SCHEMES
+from ib_perf_summary import PerfSummaryMatcher, PNL_ROW_COLUMNS, pnl_row_values
+from ib_layouts import LAYOUT_WARNING_COLUMNS
+from ib_aggregate_store import AggregateStore
+
+# pnl_data keys kept for callers of the original four-column extraction
+LEGACY_PNL_KEYS = {'stocks': 'Stocks', 'options': 'Options', 'forex': 'Forex', 'total': 'Total'}
 
 class IBStatementExtractor:
     def __init__(self):
         self.data = []
+        self.perf_summary = PerfSummaryMatcher()
+        self.source_decisions = []
+        self._last_scan = None
     
-    def extract_text_from_pdf(self, pdf_path):
-        """Extract text from PDF file"""
+    def extract_text_from_pdf(self, pdf_path, stream=None):
+        """Extract text from PDF file (or from an already open binary stream)"""
         try:
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ""
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-                return text
+            if stream is None:
+                with open(pdf_path, 'rb') as file:
+                    return self.extract_text_from_pdf(pdf_path, file)
+            
+            pdf_reader = PyPDF2.PdfReader(stream)
+            text = ""
+            for page in pdf_reader.pages:
+                text += page.extract_text() + "\n"
+            return text
         except Exception as e:
             print(f"Error reading PDF {pdf_path}: {e}")
             return None
@@ -71,7 +100,8 @@ class IBStatementExtractor:
             'stocks': 0,
             'options': 0,
             'forex': 0,
-            'total': 0
+            'total': 0,
+            'by_asset_class': {}
         }
         
         # Look for the Realized & Unrealized Performance Summary table
@@ -80,61 +110,58 @@ class IBStatementExtractor:
         
         if pnl_section:
             print(f"Found P&L section for {account_num}")
-            rows = pnl_section.find_all('tr')
+            matched = self.perf_summary.match_rows(pnl_section.find_all('tr'))
+            pnl_data['by_asset_class'] = matched
             
-            for row in rows:
-                row_classes = row.get('class', [])
-                if 'subtotal' in row_classes or 'total' in row_classes:
-                    cells = row.find_all('td')
-                    if len(cells) >= 7:
-                        first_cell = cells[0].get_text().strip()
-                        
-                        # Column 6 (index 6) contains realized total for both formats
-                        if 'Total Stocks' in first_cell:
-                            try:
-                                pnl_data['stocks'] = float(cells[6].get_text().replace(',', ''))
-                                print(f"  Stocks realized: {pnl_data['stocks']}")
-                            except Exception as e:
-                                print(f"  Error parsing stocks: {e}")
-                        
-                        elif 'Total Equity and Index Options' in first_cell:
-                            try:
-                                pnl_data['options'] = float(cells[6].get_text().replace(',', ''))
-                                print(f"  Options realized: {pnl_data['options']}")
-                            except Exception as e:
-                                print(f"  Error parsing options: {e}")
-                        
-                        elif 'Total Forex' in first_cell:
-                            try:
-                                pnl_data['forex'] = float(cells[6].get_text().replace(',', ''))
-                                print(f"  Forex realized: {pnl_data['forex']}")
-                            except Exception as e:
-                                print(f"  Error parsing forex: {e}")
-                        
-                        elif 'Total (All Assets)' in first_cell:
-                            try:
-                                pnl_data['total'] = float(cells[6].get_text().replace(',', ''))
-                                print(f"  Total realized: {pnl_data['total']}")
-                            except Exception as e:
-                                print(f"  Error parsing total: {e}")
+            for key, column in LEGACY_PNL_KEYS.items():
+                if 'Realized' in matched.get(column, {}):
+                    pnl_data[key] = matched[column]['Realized']
+                    print(f"  {column} realized: {pnl_data[key]}")
         else:
             print(f"No P&L section found for {account_num}")
         
         return pnl_data
     
-    def extract_pnl_from_html(self, html_path):
+    def section_soup(self, statement, section_id):
+        """Parse a single section of a statement (None if absent)"""
+        html = statement.section_html(section_id)
+        if html is None:
+            return None
+        return BeautifulSoup(html, 'html.parser')
+    
+    def group_pnl_sections(self, statement):
+        """Map every account to its FIFO performance section in one pass over the section index"""
+        sections_by_account = {}
+        prefix, suffix = 'tblFIFOPerfSumByUnderlying', 'Body'
+        for section_id in statement.sections():
+            if section_id.startswith(prefix) and section_id.endswith(suffix):
+                sections_by_account[section_id[len(prefix):-len(suffix)]] = section_id
+        return sections_by_account
+    
+    def extract_pnl_from_html(self, html_path, statement=None):
         """Extract P&L data directly from HTML tables"""
+        if statement is None:
+            try:
+                with StatementBuffer.open(html_path) as statement:
+                    return self.extract_pnl_from_html(html_path, statement)
+            except OSError as e:
+                print(f"Error reading HTML {html_path}: {e}")
+                return []
+        
+        summary_soup = None
         try:
-            with open(html_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-                soup = BeautifulSoup(content, 'html.parser')
+            # Only the account summary is decoded for the sniffer; fall back
+            # to the whole document for layouts without that section
+            summary_soup = self.section_soup(statement, 'tblAccountSummaryBody')
+            if summary_soup is None:
+                summary_soup = BeautifulSoup(statement.decode(), 'html.parser')
             
             # Detect format
-            format_type = self.detect_html_format(soup)
+            format_type = self.detect_html_format(summary_soup)
             print(f"Detected format: {format_type}")
             
             # Extract accounts (unified method works for both formats)
-            accounts = self.extract_accounts_from_html(soup)
+            accounts = self.extract_accounts_from_html(summary_soup)
             print(f"Found HTML accounts: {accounts}")
             
             if not accounts:
@@ -142,14 +169,23 @@ class IBStatementExtractor:
                 return []
             
             results = []
+            sections_by_account = self.group_pnl_sections(statement)
             
             # For each account, find its P&L data
             for account in accounts:
                 account_num = account['account_number']
                 print(f"Looking for P&L data for {account_num}")
                 
+                pnl_soup = None
+                if account_num in sections_by_account:
+                    pnl_soup = self.section_soup(statement, sections_by_account[account_num])
+                if pnl_soup is None:
+                    pnl_soup = summary_soup
+                
                 # Extract P&L using unified method
-                pnl_data = self.extract_pnl_from_html_section(soup, account_num)
+                pnl_data = self.extract_pnl_from_html_section(pnl_soup, account_num)
+                if pnl_soup is not summary_soup:
+                    pnl_soup.decompose()
                 
                 results.append({
                     'account': account_num,
@@ -162,19 +198,42 @@ class IBStatementExtractor:
         except Exception as e:
             print(f"Error parsing HTML {html_path}: {e}")
             return []
+        
+        finally:
+            # Break the tree's parent/child cycles so it is freed right away
+            if summary_soup is not None:
+                summary_soup.decompose()
+    
+    def parse_statement_period_from_html(self, statement):
+        """Extract the statement period, decoding only the <title> when it has one"""
+        title = statement.title()
+        if title:
+            period = self.parse_statement_period(title)
+            if period[0]:
+                return period
+        
+        soup = BeautifulSoup(statement.decode(), 'html.parser')
+        text = soup.get_text()
+        soup.decompose()
+        return self.parse_statement_period(text)
+    
+    def scan_text(self, text):
+        """Line-by-line scan of statement text, reused for the period and the accounts
+        
+        The cached scan (and the text it refers to) lives only until the
+        current extract_statement_rows call returns.
+        """
+        if self._last_scan is None or self._last_scan[0] is not text:
+            self._last_scan = (text, scan_statement_text(text))
+        return self._last_scan[1]
     
     def parse_statement_period(self, text):
         """Extract the statement period from the text"""
-        patterns = [
-            r'Activity Summary\s+(\w+ \d+, \d+) - (\w+ \d+, \d+)',
-            r'Activity Statement\s+(\w+ \d+, \d+) - (\w+ \d+, \d+)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text)
-            if match:
-                start_date = match.group(1)
-                end_date = match.group(2)
+        periods = self.scan_text(text)['period']
+        
+        for heading in PERIOD_HEADINGS:
+            if heading in periods:
+                start_date, end_date = periods[heading]
                 try:
                     date_obj = datetime.strptime(end_date, '%B %d, %Y')
                     return date_obj.year, date_obj.month, start_date, end_date
@@ -184,36 +243,31 @@ class IBStatementExtractor:
     
     def extract_account_info(self, text):
         """Extract account numbers and names from PDF text"""
-        accounts = []
+        scan = self.scan_text(text)
         
-        # Updated pattern to handle both masked and full account numbers
-        summary_pattern = r'(SGDU\*\*\*\d+|U\*\*\*\d+F?|U\d+F?)\s+([A-Za-z\s]+?)\s+[\d,]+\.?\d*\s+[\d,]+\.?\d*\s+[-\d.]+%'
-        summary_matches = re.findall(summary_pattern, text)
+        # Account summary rows (masked or full numbers), else the Account Information blocks
+        accounts = scan['summary_accounts'] or scan['info_accounts']
+        return [dict(account) for account in accounts]
+    
+    def split_pnl_sections(self, text):
+        """Split PDF text into its Realized & Unrealized Performance Summary sections"""
+        return text.split('Realized & Unrealized Performance Summary')
+    
+    def pick_pnl_section(self, sections, account_number, account_position=None, account_count=None):
+        """Index of the performance summary section belonging to an account (None if absent)"""
+        if len(sections) < 2:
+            return None
         
-        if summary_matches:
-            for match in summary_matches:
-                accounts.append({
-                    'account_number': match[0].strip(),
-                    'name': match[1].strip()
-                })
-        else:
-            # Fallback: Look for individual account sections
-            account_sections = text.split('Account Information')
-            
-            for section in account_sections[1:]:
-                account_match = re.search(r'Account\s+([UF\*\d]+F?)', section)
-                name_match = re.search(r'Name\s+([A-Za-z\s]+)', section)
-                
-                if account_match and name_match:
-                    accounts.append({
-                        'account_number': account_match.group(1).strip(),
-                        'name': name_match.group(1).strip()
-                    })
+        # Larger consolidated statements carry one section per account, in account order
+        if account_count and account_count > 2 and len(sections) - 1 == account_count:
+            return account_position + 1
         
-        return accounts
+        if 'F' in account_number:
+            return len(sections) - 1 if len(sections) > 2 else 1
+        return 1
     
-    def extract_pnl_data(self, text, account_number):
-        """Extract realized P&L data for a specific account from PDF text"""
+    def parse_pnl_section(self, section_text):
+        """Extract realized P&L totals from one performance summary section of PDF text"""
         pnl_data = {
             'stocks': {'realized': 0},
             'options': {'realized': 0},
@@ -221,72 +275,83 @@ class IBStatementExtractor:
             'total': {'realized': 0}
         }
         
-        sections = text.split('Realized & Unrealized Performance Summary')
-        
-        if len(sections) < 2:
+        if not section_text.strip():
             return pnl_data
+        lines = section_text.split('\n')
         
-        if 'F' in account_number:
-            section_to_use = sections[-1] if len(sections) > 2 else sections[1]
-        else:
-            section_to_use = sections[1]
+        # Value positions come from the section's own header, compiled once per layout
+        offsets = self.perf_summary.value_offsets(self.perf_summary.pdf_header(lines))
         
-        lines = section_to_use.split('\n')
-        
-        for i, line in enumerate(lines):
+        for line in lines:
             line = line.strip()
             
             if line.startswith('Total (All Assets)'):
-                parts = re.split(r'\s+', line)
-                if len(parts) >= 15:
-                    try:
-                        pnl_data['total']['realized'] = float(parts[8].replace(',', ''))
-                    except (ValueError, IndexError):
-                        pass
-            
+                key, label = 'total', 'Total (All Assets)'
             elif line.startswith('Total Forex'):
-                parts = re.split(r'\s+', line)
-                if len(parts) >= 14:
-                    try:
-                        pnl_data['forex']['realized'] = float(parts[7].replace(',', ''))
-                    except (ValueError, IndexError):
-                        pass
-            
+                key, label = 'forex', 'Total Forex'
             elif line.startswith('Total Stocks'):
-                parts = re.split(r'\s+', line)
-                if len(parts) >= 14:
-                    try:
-                        pnl_data['stocks']['realized'] = float(parts[7].replace(',', ''))
-                    except (ValueError, IndexError):
-                        pass
-            
+                key, label = 'stocks', 'Total Stocks'
             elif line.startswith('Options') and '0.00' in line:
-                parts = re.split(r'\s+', line)
-                if len(parts) >= 12:
-                    try:
-                        pnl_data['options']['realized'] = float(parts[5].replace(',', ''))
-                    except (ValueError, IndexError):
-                        pass
+                key, label = 'options', 'Options'
+            else:
+                continue
+            
+            value = self.perf_summary.pdf_value(line, label, offsets)
+            if value is not None:
+                pnl_data[key]['realized'] = value
         
         return pnl_data
     
-    def process_statement(self, file_path):
-        """Process a single statement file (PDF or HTML)"""
-        print(f"Processing: {file_path}")
+    def extract_pnl_data(self, text, account_number):
+        """Extract realized P&L data for a specific account from PDF text"""
+        return self.extract_pnl_data_by_account(text, [account_number])[account_number]
+    
+    def extract_pnl_data_by_account(self, text, account_numbers):
+        """Extract realized P&L for all accounts of a PDF statement in one pass
+        
+        The text is split once and each performance summary section is parsed
+        at most once, however many sub-accounts share it.
+        """
+        sections = self.split_pnl_sections(text)
+        parsed_sections = {}
+        pnl_by_account = {}
+        
+        for position, account_number in enumerate(account_numbers):
+            section_index = self.pick_pnl_section(sections, account_number, position, len(account_numbers))
+            if section_index not in parsed_sections:
+                section_text = sections[section_index] if section_index is not None else ''
+                parsed_sections[section_index] = self.parse_pnl_section(section_text)
+            
+            # Each account gets its own copy of the shared section's figures
+            pnl_by_account[account_number] = {
+                key: dict(values) for key, values in parsed_sections[section_index].items()
+            }
+        
+        return pnl_by_account
+    
+    def extract_statement_rows(self, statement):
+        """Extract the rows of one statement (PDF or HTML) without storing them"""
+        try:
+            return self._extract_rows(statement)
+        finally:
+            # The text scan is only shared within one statement; don't pin its text until the next
+            self._last_scan = None
+    
+    def _extract_rows(self, statement):
+        file_path = statement.name
+        rows = []
+        self.perf_summary.set_source(os.path.basename(file_path))
         
         if file_path.lower().endswith('.html'):
-            # Process HTML file
-            text = self.extract_text_from_html(file_path)
-            year, month, start_date, end_date = None, None, None, None
-            if text:
-                year, month, start_date, end_date = self.parse_statement_period(text)
+            # Process HTML file - one buffer shared by the period and P&L readers
+            year, month, start_date, end_date = self.parse_statement_period_from_html(statement)
             
             # Extract P&L data from HTML tables
-            pnl_results = self.extract_pnl_from_html(file_path)
+            pnl_results = self.extract_pnl_from_html(file_path, statement)
             
             if not pnl_results:
                 print(f"Could not extract P&L data from {file_path}")
-                return
+                return rows
             
             for result in pnl_results:
                 row = {
@@ -301,32 +366,37 @@ class IBStatementExtractor:
                     'Forex_Realized': result['pnl_data']['forex'],
                     'Total_Realized': result['pnl_data']['total']
                 }
+                # Realized and unrealized totals for every asset class in the summary
+                row.update(pnl_row_values(result['pnl_data']['by_asset_class']))
                 
-                self.data.append(row)
+                rows.append(row)
                 print(f"  Extracted data for {result['account']}: Realized P&L = {result['pnl_data']['total']}")
         
         else:
             # Process PDF file
-            text = self.extract_text_from_pdf(file_path)
+            text = self.extract_text_from_pdf(file_path, statement.stream())
             if not text:
-                return
+                return rows
             
             year, month, start_date, end_date = self.parse_statement_period(text)
             if not year or not month:
                 print(f"Could not parse date from {file_path}")
-                return
+                return rows
             
             accounts = self.extract_account_info(text)
             print(f"Found accounts: {accounts}")
             if not accounts:
                 print(f"Could not find account information in {file_path}")
-                return
+                return rows
+            
+            pnl_by_account = self.extract_pnl_data_by_account(
+                text, [account['account_number'] for account in accounts])
             
             for account in accounts:
                 account_number = account['account_number']
                 account_name = account['name']
                 
-                pnl_data = self.extract_pnl_data(text, account_number)
+                pnl_data = pnl_by_account[account_number]
                 
                 row = {
                     'File': os.path.basename(file_path),
@@ -341,55 +411,506 @@ class IBStatementExtractor:
                     'Total_Realized': pnl_data['total']['realized']
                 }
                 
-                self.data.append(row)
+                rows.append(row)
                 print(f"  Extracted data for {account_number}: Realized P&L = {pnl_data['total']['realized']}")
+        
+        return rows
+    
+    def process_statement(self, file_path):
+        """Process a single statement file (PDF or HTML)"""
+        print(f"Processing: {file_path}")
+        
+        try:
+            statement = StatementBuffer.open(file_path)
+        except OSError as e:
+            print(f"Error reading {file_path}: {e}")
+            return
+        
+        with statement:
+            self.data.extend(self.extract_statement_rows(statement))
     
-    def process_folder(self, folder_path):
-        """Process all PDF and HTML files in a folder"""
-        pdf_pattern = os.path.join(folder_path, "*.pdf")
-        html_pattern = os.path.join(folder_path, "*.html")
+    def find_statement_files(self, folder_path, recursive=False, start_period=None, end_period=None,
+                             prefer_html=True):
+        """PDF and HTML statement paths in a folder, in period order
         
-        files = glob.glob(pdf_pattern) + glob.glob(html_pattern)
+        Files whose names place them outside [start_period, end_period]
+        ((year, month) tuples) are pruned without being opened. With
+        prefer_html, a PDF whose statement (same folder, account and period)
+        also exists as HTML is dropped, so it is neither parsed nor counted twice.
+        """
+        index = StatementIndex(folder_path, recursive, start_period, end_period)
+        files = index.files(start_period, end_period)
+        if not prefer_html:
+            return files
+        
+        files, self.source_decisions = plan_sources(files)
+        for decision in self.source_decisions:
+            for skipped in decision['Skipped']:
+                print(f"Skipping {skipped}: same statement as {os.path.basename(decision['Chosen'])}")
+        pdf_count = sum(1 for path in files if path.lower().endswith('.pdf'))
+        print(f"Planned {len(files)} statements: {len(files) - pdf_count} HTML, {pdf_count} PDF, "
+              f"{sum(len(decision['Skipped']) for decision in self.source_decisions)} duplicates skipped")
+        return files
+    
+    def process_archive(self, archive_path, start_period=None, end_period=None):
+        """Process statements straight from a .zip/.tar(.gz) archive without unpacking it"""
+        found = False
+        for member_path, data in iter_archive_members(archive_path, start_period, end_period):
+            found = True
+            print(f"Processing: {member_path}")
+            with StatementBuffer.from_bytes(member_path, data) as statement:
+                self.data.extend(self.extract_statement_rows(statement))
+        
+        if not found:
+            print(f"No PDF or HTML files found in {archive_path}")
+    
+    def process_folder(self, folder_path, start_period=None, end_period=None, recursive=False):
+        """Process all PDF and HTML files in a folder (or a .zip/.tar.gz archive)
+        
+        start_period / end_period are (year, month) bounds matched against
+        file names, so statements outside the range are never opened or
+        decompressed. recursive walks year/month subdirectories as well.
+        """
+        if is_archive(folder_path):
+            self.process_archive(folder_path, start_period, end_period)
+            return
+        
+        files = self.find_statement_files(folder_path, recursive, start_period, end_period)
         
         if not files:
             print(f"No PDF or HTML files found in {folder_path}")
             return
         
-        files.sort()
-        
         for file_path in files:
             self.process_statement(file_path)
     
-    def save_to_excel(self, output_path="IB_PnL_Summary.xlsx"):
-        """Save extracted data to Excel"""
+    def iter_statements(self, folder_path, start_period=None, end_period=None, recursive=False):
+        """Yield one open StatementBuffer at a time for a folder or archive"""
+        if is_archive(folder_path):
+            for member_path, data in iter_archive_members(folder_path, start_period, end_period):
+                yield StatementBuffer.from_bytes(member_path, data)
+            return
+        
+        for file_path in self.find_statement_files(folder_path, recursive, start_period, end_period):
+            try:
+                yield StatementBuffer.open(file_path)
+            except OSError as e:
+                print(f"Error reading {file_path}: {e}")
+    
+    def process_folder_batch(self, folder_path, sink, chunk_size=500, memory_budget_mb=None,
+                             start_period=None, end_period=None, recursive=False):
+        """Batch mode for large backfills that keeps memory flat across files
+        
+        Rows go to sink (a callable taking a list of rows) in chunks of
+        chunk_size instead of accumulating in self.data, and each document is
+        torn down after extraction. Returns per-file memory statistics, which
+        are also printed: RSS after the file and the peak while parsing it
+        (the kernel high-water mark, reset per file where Linux allows it;
+        otherwise the larger of RSS before and after).
+        
+        memory_budget_mb is a soft limit: a single statement cannot be stopped
+        mid-parse, so a file whose peak went over it is reported (Over_Budget)
+        with a warning, and pending rows are flushed and garbage collected
+        before the next file.
+        """
+        pending = []
+        file_stats = []
+        
+        def flush():
+            if pending:
+                sink(list(pending))
+                pending.clear()
+        
+        for statement in self.iter_statements(folder_path, start_period, end_period, recursive):
+            print(f"Processing: {statement.name}")
+            rss_before = current_rss_mb()
+            peak_is_per_file = reset_peak_rss()
+            with statement:
+                rows = self.extract_statement_rows(statement)
+            pending.extend(rows)
+            
+            if len(pending) >= chunk_size:
+                flush()
+            
+            rss_mb = current_rss_mb()
+            file_peak = peak_rss_mb() if peak_is_per_file else max(filter(None, (rss_before, rss_mb)), default=None)
+            over_budget = bool(memory_budget_mb and file_peak and file_peak > memory_budget_mb)
+            if over_budget or (memory_budget_mb and rss_mb and rss_mb > memory_budget_mb):
+                flush()
+                gc.collect()
+                rss_mb = current_rss_mb()
+            
+            stats = {
+                'File': os.path.basename(statement.name),
+                'Rows': len(rows),
+                'RSS_MB': rss_mb,
+                'Peak_RSS_MB': file_peak,
+                'Over_Budget': over_budget
+            }
+            file_stats.append(stats)
+            print(f"  Memory after {stats['File']}: RSS = {stats['RSS_MB']} MB, peak = {stats['Peak_RSS_MB']} MB")
+            if over_budget:
+                print(f"  Warning: {stats['File']} peaked at {file_peak} MB, over the {memory_budget_mb} MB budget")
+        
+        flush()
+        return file_stats
+    
+    def process_folder_resumable(self, folder_path, journal, sink=None, start_period=None, end_period=None,
+                                 recursive=False):
+        """Checkpointed batch run: statements already in the journal are skipped
+        
+        Every finished statement is written to the RunJournal before the next
+        one starts, so a killed run picks up where it stopped. Newly extracted
+        rows also go to sink, if given. self.data ends up holding the rows of
+        every statement in the journal, including those from earlier runs.
+        """
+        skipped = 0
+        for statement in self.iter_statements(folder_path, start_period, end_period, recursive):
+            # Absolute paths, so a resume from another working directory still matches
+            key = os.path.abspath(statement.name)
+            with statement:
+                if key in journal:
+                    skipped += 1
+                    continue
+                print(f"Processing: {statement.name}")
+                rows = self.extract_statement_rows(statement)
+            journal.record(key, rows)
+            if sink is not None:
+                sink(rows)
+        
+        if skipped:
+            print(f"Skipped {skipped} statements finished by an earlier run")
+        self.data = journal.rows()
+        return self.data
+    
+    async def process_folder_async(self, folder_path, workers=None, max_pending=8, sink=None, executor=None,
+                                   start_period=None, end_period=None, recursive=False):
+        """Process a folder as a pipeline: async reads -> executor parsing -> sink
+        
+        Reads overlap parsing, and the bounded queues between the stages cap
+        how many statements are held in memory at once. sink receives each
+        statement's rows (plain function or coroutine); by default they are
+        appended to self.data. folder_path may also be a .zip/.tar.gz archive,
+        whose members are streamed into the pipeline.
+        """
+        loop = asyncio.get_running_loop()
+        workers = workers or os.cpu_count() or 1
+        read_queue = asyncio.Queue(maxsize=max_pending)
+        result_queue = asyncio.Queue(maxsize=max_pending)
+        if sink is None:
+            sink = self.data.extend
+        
+        async def produce_from_archive():
+            members = iter_archive_members(folder_path, start_period, end_period)
+            found = False
+            while True:
+                item = await asyncio.to_thread(next, members, None)
+                if item is None:
+                    break
+                found = True
+                await read_queue.put(item)
+            
+            if not found:
+                print(f"No PDF or HTML files found in {folder_path}")
+        
+        async def produce_from_folder():
+            files = await asyncio.to_thread(self.find_statement_files, folder_path, recursive,
+                                            start_period, end_period)
+            if not files:
+                print(f"No PDF or HTML files found in {folder_path}")
+            
+            for file_path in files:
+                try:
+                    data = await asyncio.to_thread(read_statement_bytes, file_path)
+                except OSError as e:
+                    print(f"Error reading {file_path}: {e}")
+                    continue
+                await read_queue.put((file_path, data))
+        
+        async def produce():
+            if is_archive(folder_path):
+                await produce_from_archive()
+            else:
+                await produce_from_folder()
+            for _ in range(workers):
+                await read_queue.put(None)
+        
+        async def parse(pool):
+            while True:
+                item = await read_queue.get()
+                if item is None:
+                    return
+                
+                file_path, data = item
+                try:
+                    rows, layout_warnings = await loop.run_in_executor(pool, extract_rows_from_bytes,
+                                                                       file_path, data)
+                    self.perf_summary.merge_layout_warnings(layout_warnings)
+                except Exception as e:
+                    print(f"Error processing {file_path}: {e}")
+                    rows = []
+                await result_queue.put(rows)
+        
+        async def drain():
+            while True:
+                rows = await result_queue.get()
+                if rows is None:
+                    return
+                result = sink(rows)
+                if inspect.isawaitable(result):
+                    await result
+        
+        pool = executor or ProcessPoolExecutor(max_workers=workers)
+        stages = [asyncio.create_task(produce())] + [asyncio.create_task(parse(pool)) for _ in range(workers)]
+        consumer = asyncio.create_task(drain())
+        pipeline = asyncio.gather(*stages)
+        try:
+            # Watch the sink as well: if it fails, the parsers would block on the full result queue forever
+            done, _ = await asyncio.wait({pipeline, consumer}, return_when=asyncio.FIRST_COMPLETED)
+            if consumer in done:
+                consumer.result()
+            pipeline.result()
+            await result_queue.put(None)
+            await consumer
+        finally:
+            for task in stages + [consumer]:
+                task.cancel()
+            await asyncio.gather(pipeline, consumer, return_exceptions=True)
+            if executor is None:
+                pool.shutdown()
+    
+    def process_folder_pipelined(self, folder_path, **options):
+        """Synchronous entry point for process_folder_async"""
+        asyncio.run(self.process_folder_async(folder_path, **options))
+    
+    def save_to_excel(self, output_path="IB_PnL_Summary.xlsx", aggregate_store=None,
+                      fx_table=None, reporting_currency=None, statement_keys=None):
+        """Save extracted data to Excel
+        
+        With an AggregateStore, this run's statements are folded into the
+        stored rollups and both summary sheets are served from the store, so
+        they cover every statement ever applied, not only this run.
+        statement_keys (one per row of self.data) names the statement each
+        row is stored under; by default its File.
+        With an FxRateTable and a reporting_currency, every P&L column is
+        converted out of each account's base currency before anything is summed.
+        """
         if not self.data:
             print("No data to save")
             return
         
         df = pd.DataFrame(self.data)
+        if statement_keys is not None:
+            df['_Statement'] = statement_keys
+        if fx_table is not None and reporting_currency:
+            df = fx_table.normalize(df, reporting_currency)
+            print(f"Converted P&L to {reporting_currency}")
         df = df.sort_values(['Year', 'Month', 'Account'])
+        keys = df.pop('_Statement').tolist() if statement_keys is not None else None
         
-        with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='Raw_Data', index=False)
-            
-            summary_by_year = df.groupby(['Account', 'Year']).agg({
-                'Stocks_Realized': 'sum',
-                'Options_Realized': 'sum', 
-                'Forex_Realized': 'sum',
-                'Total_Realized': 'sum'
-            }).reset_index()
-            summary_by_year.to_excel(writer, sheet_name='Summary_by_Year', index=False)
-            
-            monthly_summary = df.pivot_table(
-                index=['Year', 'Month'],
-                columns='Account',
-                values='Total_Realized',
-                aggfunc='sum'
-            ).reset_index()
-            monthly_summary.to_excel(writer, sheet_name='Monthly_Summary', index=False)
+        if aggregate_store is not None:
+            updated = aggregate_store.update_from_rows(df.to_dict('records'), keys)
+            aggregate_store.save()
+            print(f"Updated aggregates for {len(updated)} statements")
+            summary_by_year = aggregate_store.summary_by_year()
+            monthly_summary = aggregate_store.monthly_summary()
+        else:
+            summary_by_year, monthly_summary = build_summaries(df)
+        
+        sheets = {
+            'Raw_Data': df,
+            'Summary_by_Year': summary_by_year,
+            'Monthly_Summary': monthly_summary
+        }
+        # Tables whose header layout was unknown or unusable, so drift is visible next to the numbers
+        layout_warnings = self.perf_summary.layout_warnings()
+        if layout_warnings:
+            sheets['Layout_Warnings'] = pd.DataFrame(layout_warnings, columns=LAYOUT_WARNING_COLUMNS)
+            print(f"{len(layout_warnings)} unrecognised table layouts; see the Layout_Warnings sheet")
+        write_workbook(output_path, sheets)
         
         print(f"Data saved to {output_path}")
         print(f"Processed {len(df)} account-month combinations")
+    
+    def save_partitioned(self, output_dir="IB_PnL_Partitions", by='year', fx_table=None, reporting_currency=None,
+                         removed_files=()):
+        """Write one workbook per year (or account-year) plus an index workbook
+        
+        Rows from this run replace earlier rows of the same statements in the
+        partition manifest, and only partitions whose content hash changed
+        are rewritten, so a monthly refresh touches a single small file.
+        Rows of the statements named in removed_files are dropped.
+        """
+        if not self.data and not removed_files:
+            print("No data to save")
+            return []
+        
+        df = pd.DataFrame(self.data)
+        if fx_table is not None and reporting_currency and self.data:
+            df = fx_table.normalize(df, reporting_currency)
+            print(f"Converted P&L to {reporting_currency}")
+        
+        os.makedirs(output_dir, exist_ok=True)
+        manifest = PartitionManifest(output_dir, by)
+        changed = manifest.update(df.to_dict('records'), removed_files)
+        for key, rows in sorted(changed.items()):
+            if not rows:
+                if os.path.exists(manifest.workbook_path(key)):
+                    os.remove(manifest.workbook_path(key))
+                print(f"Removed empty partition {key}")
+                continue
+            partition = pd.DataFrame(rows).sort_values(['Year', 'Month', 'Account'])
+            summary_by_year, monthly_summary = build_summaries(partition)
+            write_workbook(manifest.workbook_path(key), {
+                'Raw_Data': partition,
+                'Summary_by_Year': summary_by_year,
+                'Monthly_Summary': monthly_summary
+            })
+            print(f"Wrote partition {key} ({len(partition)} rows)")
+        
+        index_path = os.path.join(output_dir, f"IB_PnL_Index_{by}.xlsx")
+        if changed or not os.path.exists(index_path):
+            write_workbook(index_path, {'Partitions': pd.DataFrame(manifest.index_rows())})
+        manifest.save()
+        
+        print(f"{len(changed)} of {len(manifest.partitions)} partitions changed in {output_dir}")
+        return sorted(changed)
+
+ROW_COLUMNS = [
+    'File', 'Year', 'Month', 'Period', 'Account', 'Name',
+    'Stocks_Realized', 'Options_Realized', 'Forex_Realized', 'Total_Realized'
+]
+ROW_COLUMNS += [column for column in PNL_ROW_COLUMNS if column not in ROW_COLUMNS]
+
+def _sum_unless_missing(df, keys, columns):
+    """Group sums that stay NaN wherever a row in the group is NaN (such as P&L with no FX rate)"""
+    grouped = df.groupby(keys)[columns]
+    missing = df[columns].isna().groupby([df[key] for key in keys]).any()
+    return grouped.sum().mask(missing)
+
+def build_summaries(df):
+    """Summary_by_Year and Monthly_Summary sheets for a frame of rows
+    
+    Amounts left NaN (no FX rate to convert them) make their year and
+    month NaN instead of being skipped, so a partial total never looks complete.
+    """
+    summary_by_year = _sum_unless_missing(
+        df, ['Account', 'Year'], ['Stocks_Realized', 'Options_Realized', 'Forex_Realized', 'Total_Realized']
+    ).reset_index()
+    
+    monthly_summary = _sum_unless_missing(
+        df, ['Year', 'Month', 'Account'], ['Total_Realized']
+    )['Total_Realized'].unstack('Account').reset_index()
+    return summary_by_year, monthly_summary
+
+def write_workbook(output_path, sheets):
+    """Write {sheet name: frame} beside the target and swap it in, so a crash never leaves a half-written workbook"""
+    base, extension = os.path.splitext(output_path)
+    temp_path = f"{base}.partial{extension}"
+    with pd.ExcelWriter(temp_path, engine='openpyxl') as writer:
+        for sheet_name, frame in sheets.items():
+            frame.to_excel(writer, sheet_name=sheet_name, index=False)
+    os.replace(temp_path, output_path)
+
+class CsvRowSink:
+    """Append extracted rows to a CSV file chunk by chunk"""
+    
+    def __init__(self, output_path, columns=None):
+        self.output_path = output_path
+        self.columns = columns or ROW_COLUMNS
+        self.rows_written = 0
+        self._header_written = os.path.exists(output_path) and os.path.getsize(output_path) > 0
+    
+    def __call__(self, rows):
+        with open(self.output_path, 'a', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=self.columns, extrasaction='ignore')
+            if not self._header_written:
+                writer.writeheader()
+                self._header_written = True
+            writer.writerows(rows)
+            file.flush()
+        self.rows_written += len(rows)
+
+class StreamingRowWriter:
+    """Write rows to a text stream as NDJSON or CSV as soon as they are extracted"""
+    
+    FORMATS = ('ndjson', 'csv')
+    
+    def __init__(self, stream, output_format='ndjson', columns=None, flush_per_file=True, write_header=True):
+        if output_format not in self.FORMATS:
+            raise ValueError(f"Unknown output format {output_format!r}, expected one of {self.FORMATS}")
+        self.stream = stream
+        self.output_format = output_format
+        self.columns = columns or ROW_COLUMNS
+        self.flush_per_file = flush_per_file
+        self.write_header = write_header
+        self.rows_written = 0
+        self._csv_writer = None
+    
+    def __call__(self, rows):
+        if self.output_format == 'csv':
+            if self._csv_writer is None:
+                self._csv_writer = csv.DictWriter(self.stream, fieldnames=self.columns, extrasaction='ignore')
+                if self.write_header:
+                    self._csv_writer.writeheader()
+            self._csv_writer.writerows(rows)
+        else:
+            for row in rows:
+                self.stream.write(json.dumps(row, default=str) + '\n')
+        if self.flush_per_file:
+            self.stream.flush()
+        self.rows_written += len(rows)
+
+def current_rss_mb():
+    """Resident set size of this process in MB (None where /proc is unavailable)"""
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return round(pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024), 1)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+def reset_peak_rss():
+    """Restart the kernel's resident-set high-water mark (Linux only); False where unsupported"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+def peak_rss_mb():
+    """Peak resident set size in MB since the last reset_peak_rss (or process start)"""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(peak / divisor, 1)
+
+def read_statement_bytes(file_path):
+    """Read a whole statement file (used by the async pipeline's reader threads)"""
+    with open(file_path, 'rb') as file:
+        return file.read()
+
+def extract_rows_from_bytes(file_path, data):
+    """Executor entry point: (rows, layout warnings) for a statement already read into memory
+    
+    The warnings travel back with the rows so the parent process can merge
+    them into its own matcher (see PerfSummaryMatcher.merge_layout_warnings).
+    """
+    print(f"Processing: {file_path}")
+    extractor = IBStatementExtractor()
+    with StatementBuffer.from_bytes(file_path, data) as statement:
+        rows = extractor.extract_statement_rows(statement)
+    return rows, extractor.perf_summary.layout_warnings()
 
 def test_extraction_with_2021_file():
     """Test the extraction with the 2021 file"""
@@ -425,16 +946,92 @@ def test_extraction_with_2021_file():
     except Exception as e:
         print(f"Error during extraction: {e}")
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Extract realized P&L from IB activity statements")
+    parser.add_argument('folder', nargs='?', help="statements folder or archive (prompted for if omitted)")
+    parser.add_argument('--format', dest='output_format', choices=('xlsx',) + StreamingRowWriter.FORMATS,
+                        default='xlsx', help="xlsx summary at the end, or rows streamed as NDJSON/CSV")
+    parser.add_argument('--output', default=None,
+                        help="output file ('-' for stdout; default IB_PnL_Summary.xlsx or stdout when streaming)")
+    parser.add_argument('--no-flush-per-file', dest='flush_per_file', action='store_false',
+                        help="let the stream buffer rows instead of flushing after each statement")
+    parser.add_argument('--recursive', action='store_true', help="include statements in subfolders")
+    parser.add_argument('--journal', default=None,
+                        help="checkpoint journal of finished statements (default: <output>.journal)")
+    parser.add_argument('--partition', choices=PARTITION_SCHEMES, default=None,
+                        help="xlsx only: one workbook per year or account-year in --output (a folder)")
+    parser.add_argument('--resume', action='store_true',
+                        help="skip statements the journal records as finished instead of starting over")
+    parser.add_argument('--aggregates', default=None,
+                        help="xlsx only: aggregate store to fold this run into; the summary sheets then "
+                             "cover every statement it holds")
+    return parser.parse_args(argv)
+
+def stream_rows(extractor, folder_path, output_format, output=None, flush_per_file=True, recursive=False,
+                journal=None):
+    """Stream rows per statement; progress messages go to stderr so stdout stays machine-readable
+    
+    With a journal, statements finished by an earlier run are not re-emitted
+    and a resumed file output is appended to rather than overwritten.
+    """
+    appending = False
+    if output in (None, '-'):
+        target = contextlib.nullcontext(sys.stdout)
+    else:
+        appending = journal is not None and len(journal) > 0 and os.path.exists(output)
+        target = open(output, 'a' if appending else 'w', newline='', encoding='utf-8')
+    with target as stream, contextlib.redirect_stdout(sys.stderr):
+        writer = StreamingRowWriter(stream, output_format, flush_per_file=flush_per_file,
+                                    write_header=not appending)
+        if journal is None:
+            extractor.process_folder_batch(folder_path, writer, chunk_size=1, recursive=recursive)
+        else:
+            extractor.process_folder_resumable(folder_path, journal, writer, recursive=recursive)
+    print(f"Streamed {writer.rows_written} rows", file=sys.stderr)
+    return writer.rows_written
+
+def main(argv=None):
     """Main function to process statements"""
+    args = parse_args(argv)
     extractor = IBStatementExtractor()
     
-    folder_path = input("Enter the path to your statements folder: ").strip()
-    if os.path.exists(folder_path):
-        extractor.process_folder(folder_path)
-        extractor.save_to_excel("IB_PnL_Summary.xlsx")
-    else:
+    folder_path = args.folder or input("Enter the path to your statements folder: ").strip()
+    if not os.path.exists(folder_path):
         print("Folder not found. Please check the path.")
+        return
+    
+    if args.output_format == 'xlsx':
+        # Batch runs always keep a checkpoint journal; it is removed once the workbook is written
+        output_path = args.output or ("IB_PnL_Partitions" if args.partition else "IB_PnL_Summary.xlsx")
+        with RunJournal(args.journal or output_path.rstrip(os.sep) + '.journal', resume=args.resume) as journal:
+            extractor.process_folder_resumable(folder_path, journal, recursive=args.recursive)
+        if args.partition:
+            if args.aggregates:
+                print("--aggregates is ignored with --partition")
+            extractor.save_partitioned(output_path, args.partition)
+        elif args.aggregates:
+            # Stored statements are keyed like the journal (absolute path), so same-named files stay apart
+            statement_keys = [key for key, rows in journal.completed.items() for _ in rows]
+            extractor.save_to_excel(output_path, AggregateStore(args.aggregates), statement_keys=statement_keys)
+        else:
+            extractor.save_to_excel(output_path)
+        if os.path.exists(output_path):
+            os.remove(journal.path)
+    else:
+        journal = None
+        if args.journal or args.resume:
+            default_journal = (args.output if args.output not in (None, '-') else 'IB_PnL_Stream') + '.journal'
+            journal = RunJournal(args.journal or default_journal, resume=args.resume)
+        try:
+            stream_rows(extractor, folder_path, args.output_format, args.output,
+                        args.flush_per_file, args.recursive, journal)
+        except BrokenPipeError:
+            # The downstream reader went away (e.g. `| head`); stop quietly
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, sys.stdout.fileno())
+        finally:
+            if journal is not None:
+                journal.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,162 @@
+import os
+import gzip
+import json
+import html
+from bs4 import BeautifulSoup
+from ib_statement_reader import read_statement_file, html_paths, write_json_atomic
+
+FRAGMENT_FORMAT = 1
+
+
+def _split_section(section_html):
+    """[[is_header, classes, cells], ...] for a section, or None if it has no table rows"""
+    soup = BeautifulSoup(section_html, 'html.parser')
+    rows = []
+    for row in soup.find_all('tr'):
+        cells = row.find_all(['th', 'td'])
+        rows.append([
+            1 if row.find('th') is not None else 0,
+            row.get('class', []),
+            [cell.get_text().strip() for cell in cells],
+        ])
+    soup.decompose()
+    return rows or None
+
+
+def section_rows(statement, section_id):
+    """(is_header, cell texts) per <tr> of a section, from the fragment cache when available"""
+    if hasattr(statement, 'section_rows'):
+        return statement.section_rows(section_id)
+    section_html = statement.section_html(section_id)
+    if section_html is None:
+        return []
+    return [(bool(is_header), cells) for is_header, _, cells in _split_section(section_html) or []]
+
+
+class CachedStatement:
+    """A statement served from its cached fragments instead of its HTML
+
+    Offers the parts of the StatementBuffer interface extractors use
+    (name, sha256, title, sections, section_html) plus section_rows, which
+    returns the pre-split cell text directly.
+    """
+
+    def __init__(self, name, file_hash, title, sections):
+        self.name = name
+        self.file_hash = file_hash
+        self._title = title
+        self._sections = sections
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def close(self):
+        pass
+
+    def sha256(self):
+        return self.file_hash
+
+    def title(self):
+        return self._title
+
+    def sections(self):
+        return {section_id: None for section_id in self._sections}
+
+    def section_rows(self, section_id):
+        fragment = self._sections.get(section_id)
+        if not fragment or 'rows' not in fragment:
+            return []
+        return [(bool(is_header), cells) for is_header, _, cells in fragment['rows']]
+
+    def section_html(self, section_id):
+        """Section markup; table sections are rebuilt from their rows (text and row classes only)"""
+        fragment = self._sections.get(section_id)
+        if fragment is None:
+            return None
+        if 'html' in fragment:
+            return fragment['html']
+        parts = [f'<div id="{section_id}"><table>']
+        for is_header, classes, cells in fragment['rows']:
+            tag = 'th' if is_header else 'td'
+            class_attribute = f' class="{html.escape(" ".join(classes))}"' if classes else ''
+            parts.append(f'<tr{class_attribute}>' +
+                         ''.join(f'<{tag}>{html.escape(cell)}</{tag}>' for cell in cells) + '</tr>')
+        parts.append('</table></div>')
+        return ''.join(parts)
+
+
+class FragmentCache:
+    """Per-statement cache of pre-split tbl*Body sections, keyed by file hash
+
+    Each HTML statement is parsed once into row/cell text arrays (sections
+    without table rows, such as the 2013 charts, keep their raw markup) and
+    stored as gzipped JSON. New or changed extractors can then run over
+    every cached statement without reading or parsing the original HTML:
+
+        for statement in FragmentCache().statements():
+            engine.add_statement(statement)
+    """
+
+    def __init__(self, cache_dir="IB_Fragment_Cache"):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path_for(self, file_hash):
+        return os.path.join(self.cache_dir, file_hash[:2], f"{file_hash}.json.gz")
+
+    def load(self, file_hash):
+        """The cached statement for a hash, or None"""
+        path = self.path_for(file_hash)
+        if not os.path.exists(path):
+            return None
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as file:
+                stored = json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"Error reading cached fragments {path}: {e}")
+            return None
+        if stored.get('format') != FRAGMENT_FORMAT:
+            return None
+        return CachedStatement(stored['name'], file_hash, stored['title'], stored['sections'])
+
+    def build(self, statement):
+        """Split every section of an open StatementBuffer and store the fragments"""
+        file_hash = statement.sha256()
+        sections = {}
+        for section_id in statement.sections():
+            section_html = statement.section_html(section_id)
+            rows = _split_section(section_html)
+            sections[section_id] = {'rows': rows} if rows is not None else {'html': section_html}
+
+        stored = {'format': FRAGMENT_FORMAT, 'name': statement.name, 'title': statement.title(),
+                  'sections': sections}
+        path = self.path_for(file_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_json_atomic(path, stored, compress=True, separators=(',', ':'))
+        return CachedStatement(statement.name, file_hash, stored['title'], sections)
+
+    def statement(self, statement):
+        """Cached view of an open StatementBuffer, building it on first sight"""
+        return self.load(statement.sha256()) or self.build(statement)
+
+    def add_file(self, file_path):
+        """Cache one HTML statement; returns its hash (None on error)"""
+        return read_statement_file(file_path, lambda statement: self.statement(statement).file_hash)
+
+    def add_files(self, file_paths):
+        hashes = [self.add_file(path) for path in html_paths(file_paths)]
+        cached = [file_hash for file_hash in hashes if file_hash]
+        print(f"{len(cached)} statements in fragment cache {self.cache_dir}")
+        return cached
+
+    def statements(self):
+        """Every cached statement, without touching any original file"""
+        for directory, _, files in os.walk(self.cache_dir):
+            for file_name in sorted(files):
+                if file_name.endswith('.json.gz'):
+                    cached = self.load(file_name[:-len('.json.gz')])
+                    if cached is not None:
+                        yield cached
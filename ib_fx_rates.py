@@ -0,0 +1,285 @@
+import os
+import re
+import json
+import numpy as np
+import pandas as pd
+from ib_statement_reader import read_statement_file, html_paths, write_json_atomic
+from ib_statement_fields import CURRENCY_PATTERN, parse_number, period_bounds, base_currencies
+from ib_fragment_cache import section_rows
+
+PNL_AMOUNT_COLUMNS = ['Stocks_Realized', 'Options_Realized', 'Forex_Realized', 'Total_Realized']
+# Masked PDF accounts such as SGDU***6153 carry their base currency as a prefix
+ACCOUNT_CURRENCY_PATTERN = re.compile(r'^([A-Z]{3})U')
+PIVOT_CURRENCIES = ('USD', 'EUR', 'SGD', 'GBP', 'HKD')
+
+
+def _period_end(period):
+    """'November 1, 2021 - November 30, 2021' (or a title holding it) -> datetime64 day of the period end"""
+    end = period_bounds(period)[1]
+    return np.datetime64(end, 'D') if end else np.datetime64('NaT', 'D')
+
+
+class FxRateTable:
+    """Per-date FX rates harvested from the statements themselves
+
+    Rates are read from tblFxPositions (close prices at period end),
+    tblFxTransactions (proceeds vs. quantity on the trade date) and, for a
+    single otherwise-unpriced currency, solved from the cash report's base
+    currency summary. Each currency pair is indexed as sorted date/rate
+    arrays for as-of lookups. The table is cached on disk, keyed by statement
+    hash, so a statement is only read once.
+    """
+
+    def __init__(self, cache_path="IB_FX_Rates.json"):
+        self.cache_path = cache_path
+        # (currency, quote) -> {date string: rate}
+        self.observations = {}
+        # (file name, account) -> base currency
+        self.base_currencies = {}
+        self.sources = set()
+        self._index = {}
+        self.load()
+
+    def load(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as file:
+                cached = json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"Error reading FX cache {self.cache_path}: {e}")
+            return
+        self.observations = {tuple(pair.split('/')): rates for pair, rates in cached.get('rates', {}).items()}
+        self.base_currencies = {tuple(key.split('|', 1)): currency
+                                for key, currency in cached.get('base_currencies', {}).items()}
+        self.sources = set(cached.get('sources', []))
+        self._index = {}
+
+    def save(self):
+        if not self.cache_path:
+            return
+        cached = {
+            'rates': {'/'.join(pair): rates for pair, rates in self.observations.items()},
+            'base_currencies': {'|'.join(key): currency for key, currency in self.base_currencies.items()},
+            'sources': sorted(self.sources),
+        }
+        write_json_atomic(self.cache_path, cached)
+
+    def add_rate(self, date, currency, quote, rate):
+        """Record that 1 unit of currency was worth rate units of quote on date"""
+        if currency == quote or not rate or np.isnat(date):
+            return
+        self.observations.setdefault((currency, quote), {})[str(date)] = abs(rate)
+        self.observations.setdefault((quote, currency), {})[str(date)] = 1 / abs(rate)
+        self._index.pop((currency, quote), None)
+        self._index.pop((quote, currency), None)
+
+    def add_file(self, file_path):
+        """Harvest rates from one HTML statement (skipped if already cached)"""
+        return read_statement_file(file_path, self.add_statement, 0)
+
+    def add_files(self, file_paths):
+        added = sum(self.add_file(path) for path in html_paths(file_paths))
+        self.save()
+        return added
+
+    def add_statement(self, statement):
+        file_hash = statement.sha256()
+        if file_hash in self.sources:
+            return 0
+
+        period_end = _period_end(statement.title())
+        file_name = os.path.basename(statement.name)
+        for account, currency in base_currencies(statement).items():
+            self.base_currencies[(file_name, account)] = currency
+
+        count = 0
+        for section_id in statement.sections():
+            if section_id.startswith('tblFxPositions_'):
+                count += self._add_fx_positions(statement, section_id, period_end)
+            elif section_id.startswith('tblFxTransactions_'):
+                count += self._add_fx_transactions(statement, section_id)
+
+        for section_id in statement.sections():
+            if section_id.startswith('tblCashReport_'):
+                account = section_id[len('tblCashReport_'):-len('Body')]
+                base = self.base_currencies.get((file_name, account))
+                if base:
+                    count += self._add_cash_report(statement, section_id, base, period_end)
+
+        self.sources.add(file_hash)
+        print(f"Collected {count} FX rates from {statement.name}")
+        return count
+
+    def _add_fx_positions(self, statement, section_id, period_end):
+        count = 0
+        quote = None
+        close_price = None
+        for is_header, cells in section_rows(statement, section_id):
+            if is_header:
+                close_price = cells.index('Close Price') if 'Close Price' in cells else None
+                for cell in cells:
+                    if cell.startswith('Value in'):
+                        quote = cell.split()[-1]
+                continue
+            if close_price is None or quote is None or len(cells) <= close_price:
+                continue
+            if CURRENCY_PATTERN.match(cells[0]):
+                rate = parse_number(cells[close_price])
+                if rate:
+                    self.add_rate(period_end, cells[0], quote, rate)
+                    count += 1
+        return count
+
+    def _add_fx_transactions(self, statement, section_id):
+        count = 0
+        columns = {}
+        proceeds_column = None
+        quote = None
+        for is_header, cells in section_rows(statement, section_id):
+            if is_header:
+                columns = {cell: i for i, cell in enumerate(cells)}
+                proceeds_column = None
+                for i, cell in enumerate(cells):
+                    if cell.startswith('Proceeds in'):
+                        proceeds_column, quote = i, cell.split()[-1]
+                continue
+            needed = ('Date/Time', 'FX Currency', 'Quantity')
+            if proceeds_column is None or any(name not in columns for name in needed) or len(cells) < len(columns):
+                continue
+            proceeds = parse_number(cells[proceeds_column])
+            quantity = parse_number(cells[columns['Quantity']])
+            if not proceeds or not quantity:
+                continue
+            try:
+                date = np.datetime64(cells[columns['Date/Time']].split(',')[0], 'D')
+            except ValueError:
+                continue
+            self.add_rate(date, cells[columns['FX Currency']], quote, proceeds / quantity)
+            count += 1
+        return count
+
+    def _add_cash_report(self, statement, section_id, base, period_end):
+        # Ending cash per currency plus the base-currency total pins down one unknown rate
+        ending = {}
+        currency = None
+        for is_header, cells in section_rows(statement, section_id):
+            if is_header or not cells:
+                continue
+            if len(cells) == 1:
+                currency = 'BASE' if cells[0] == 'Base Currency Summary' else cells[0]
+            elif cells[0] == 'Ending Cash' and currency:
+                ending[currency] = parse_number(cells[1])
+
+        base_total = ending.pop('BASE', None)
+        if base_total is None:
+            return 0
+        known = ending.pop(base, 0.0) or 0.0
+        unknown = []
+        for other, amount in ending.items():
+            if not amount:
+                continue
+            rate = self._lookup(other, base, period_end, exact=True)
+            if rate is None:
+                unknown.append((other, amount))
+            else:
+                known += amount * rate
+        if len(unknown) != 1:
+            return 0
+        other, amount = unknown[0]
+        rate = (base_total - known) / amount
+        if rate <= 0:
+            return 0
+        self.add_rate(period_end, other, base, rate)
+        return 1
+
+    def _series(self, currency, quote):
+        pair = (currency, quote)
+        if pair not in self._index:
+            observed = self.observations.get(pair)
+            if not observed:
+                return None
+            dates = np.array(sorted(observed), dtype='datetime64[D]')
+            rates = np.array([observed[str(date)] for date in dates])
+            self._index[pair] = (dates, rates)
+        return self._index[pair]
+
+    def _lookup(self, currency, quote, date, exact=False):
+        series = self._series(currency, quote)
+        if series is None:
+            return None
+        dates, rates = series
+        position = np.searchsorted(dates, date, side='right') - 1
+        if position < 0:
+            return None
+        if exact:
+            return rates[position] if dates[position] == date else None
+        return rates[position]
+
+    def rates(self, currency, quote, dates):
+        """As-of rates (latest on or before each date) converting currency into quote"""
+        dates = np.asarray(dates, dtype='datetime64[D]')
+        if currency == quote:
+            return np.ones(len(dates))
+
+        series = self._series(currency, quote)
+        if series is not None:
+            known_dates, known_rates = series
+            positions = np.searchsorted(known_dates, dates, side='right') - 1
+            # Dates before the first observation have no rate on or before them
+            unknown = np.isnat(dates) | (positions < 0)
+            return np.where(unknown, np.nan, known_rates[np.clip(positions, 0, None)])
+
+        # Cross through a pivot currency when there is no direct observation
+        for pivot in PIVOT_CURRENCIES + tuple(sorted({pair[1] for pair in self.observations})):
+            if pivot in (currency, quote):
+                continue
+            if self._series(currency, pivot) is not None and self._series(pivot, quote) is not None:
+                return self.rates(currency, pivot, dates) * self.rates(pivot, quote, dates)
+        return np.full(len(dates), np.nan)
+
+    def base_currency(self, file_name, account):
+        currency = self.base_currencies.get((os.path.basename(str(file_name)), account))
+        if currency:
+            return currency
+        match = ACCOUNT_CURRENCY_PATTERN.match(str(account))
+        return match.group(1) if match else None
+
+    def normalize(self, df, reporting_currency, amount_columns=None):
+        """Convert P&L columns of extractor rows into reporting_currency in bulk
+
+        Adds Base_Currency, Reporting_Currency and FX_Rate columns. Rows whose
+        base currency or rate is unknown keep NaN amounts, so they cannot be
+        summed silently with converted ones.
+        """
+        if amount_columns is None:
+            amount_columns = PNL_AMOUNT_COLUMNS + [column for column in df.columns
+                                                   if column.endswith(('_Realized', '_Unrealized'))]
+        amount_columns = list(dict.fromkeys(column for column in amount_columns if column in df.columns))
+        df = df.copy()
+        df['Base_Currency'] = [self.base_currency(file_name, account)
+                               for file_name, account in zip(df['File'], df['Account'])]
+        dates = np.array([_period_end(period) for period in df['Period']], dtype='datetime64[D]')
+
+        fx_rate = np.full(len(df), np.nan)
+        for currency in df['Base_Currency'].dropna().unique():
+            mask = (df['Base_Currency'] == currency).to_numpy()
+            fx_rate[mask] = self.rates(currency, reporting_currency, dates[mask])
+
+        missing = df.loc[np.isnan(fx_rate), ['File', 'Account']]
+        for file_name, account in missing.drop_duplicates().itertuples(index=False):
+            print(f"No {reporting_currency} rate for {account} in {file_name}")
+
+        df['Reporting_Currency'] = reporting_currency
+        df['FX_Rate'] = fx_rate
+        df[amount_columns] = df[amount_columns].astype(float).mul(fx_rate, axis=0)
+        return df
+
+    def to_frame(self):
+        """All observations as a Date/Currency/Quote/Rate table"""
+        records = [
+            {'Date': date, 'Currency': currency, 'Quote': quote, 'Rate': rate}
+            for (currency, quote), observed in self.observations.items()
+            for date, rate in observed.items()
+        ]
+        return pd.DataFrame(records, columns=['Date', 'Currency', 'Quote', 'Rate'])
@@ -0,0 +1,80 @@
+import hashlib
+
+LAYOUT_WARNING_COLUMNS = ['Table', 'Signature', 'Problem', 'Header', 'First_Seen_In', 'Count']
+
+
+def header_signature(header_cells):
+    """Short stable fingerprint of a table header row"""
+    return hashlib.sha1('\x1f'.join(header_cells).encode('utf-8')).hexdigest()[:12]
+
+
+class ParsePlanCache:
+    """Column plans compiled once per table-header signature
+
+    compile_plan turns a header row into whatever lookup the parser needs
+    (cell indexes, value offsets, ...) and runs once per distinct layout;
+    every later table with the same header reuses the cached plan. Headers
+    whose signature is not in known_signatures, or whose plan fails
+    validate, are flagged once with the statement they first appeared in,
+    so a column IB adds or moves is reported instead of silently shifting
+    numbers. A plan that fails validate is replaced by the plan of
+    fallback_header when one is given, rather than used broken.
+    """
+
+    def __init__(self, table, compile_plan, known_signatures=(), validate=None, fallback_header=None):
+        self.table = table
+        self.compile_plan = compile_plan
+        self.known_signatures = set(known_signatures)
+        self.validate = validate
+        self.fallback_header = fallback_header
+        # Statement currently being parsed, for the warning report
+        self.source = None
+        self.plans = {}
+        self.warnings = {}
+
+    def plan(self, header_cells):
+        header = tuple(header_cells)
+        signature = header_signature(header)
+        plan = self.plans.get(signature)
+        if plan is None:
+            plan = self.compile_plan(header)
+            problem = self.validate(plan) if self.validate else None
+            if problem and self.fallback_header is not None:
+                plan = self.compile_plan(tuple(self.fallback_header))
+                problem += ', standard layout assumed'
+            elif problem is None and signature not in self.known_signatures:
+                problem = 'unknown layout'
+            self.plans[signature] = plan
+            if problem:
+                self.flag(signature, header, problem)
+        elif signature in self.warnings:
+            self.warnings[signature]['Count'] += 1
+        return plan
+
+    def flag(self, signature, header, problem):
+        if signature in self.warnings:
+            self.warnings[signature]['Count'] += 1
+            return
+        print(f"Warning: {self.table} header {signature} in {self.source}: {problem} ({' | '.join(header)})")
+        self.warnings[signature] = {
+            'Table': self.table,
+            'Signature': signature,
+            'Problem': problem,
+            'Header': ' | '.join(header),
+            'First_Seen_In': self.source,
+            'Count': 1,
+        }
+
+    def merge(self, warning_rows):
+        """Fold in warnings reported elsewhere (a worker process or another shard)"""
+        for warning in warning_rows:
+            if warning['Table'] != self.table:
+                continue
+            known = self.warnings.get(warning['Signature'])
+            if known is None:
+                self.warnings[warning['Signature']] = dict(warning)
+            else:
+                known['Count'] += warning['Count']
+
+    def warning_rows(self):
+        return list(self.warnings.values())
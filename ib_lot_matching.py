@@ -0,0 +1,293 @@
+import numpy as np
+import pandas as pd
+from bs4 import BeautifulSoup
+from ib_statement_reader import read_statement_file, html_paths
+from ib_statement_fields import CURRENCY_PATTERN, parse_number
+
+TRADE_ROW_CLASSES = {'row-summary', 'summaryRow'}
+LOT_METHODS = ('fifo', 'lifo', 'specific')
+
+# Header names differ slightly between statement generations
+TRADE_COLUMNS = {
+    'symbol': ('Symbol',),
+    'date_time': ('Date/Time',),
+    'quantity': ('Quantity',),
+    'proceeds': ('Proceeds',),
+    'commission': ('Comm/Fee', 'Comm/Tax'),
+    'basis': ('Basis',),
+    'ib_realized': ('Realized P/L',),
+    'code': ('Code',),
+}
+
+
+def _trade_column_indexes(header_cells):
+    indexes = {}
+    for key, names in TRADE_COLUMNS.items():
+        for name in names:
+            if name in header_cells:
+                indexes[key] = header_cells.index(name)
+                break
+    return indexes
+
+
+def extract_trades(statement):
+    """Per-trade rows from every tblTransactions_<account>Body section of a statement
+
+    Sections without a Basis column (Forex conversions) are skipped, since
+    they carry no lots to match.
+    """
+    trades = []
+    prefix, suffix = 'tblTransactions_', 'Body'
+    for section_id in statement.sections():
+        if not (section_id.startswith(prefix) and section_id.endswith(suffix)):
+            continue
+        account = section_id[len(prefix):-len(suffix)]
+
+        soup = BeautifulSoup(statement.section_html(section_id), 'html.parser')
+        columns = {}
+        asset_class = None
+        currency = None
+        for row in soup.find_all('tr'):
+            headers = row.find_all('th')
+            if headers:
+                columns = _trade_column_indexes([cell.get_text().strip() for cell in headers])
+                continue
+
+            cells = row.find_all('td')
+            if len(cells) == 1:
+                label = cells[0].get_text().strip()
+                if CURRENCY_PATTERN.match(label):
+                    currency = label
+                elif label:
+                    asset_class = label
+                continue
+
+            if not TRADE_ROW_CLASSES.intersection(row.get('class', [])):
+                continue
+            if 'basis' not in columns or 'quantity' not in columns:
+                continue
+
+            values = [cell.get_text().strip() for cell in cells]
+            try:
+                trade_time = np.datetime64(values[columns['date_time']].replace(', ', 'T').replace(' ', 'T'), 's')
+            except (ValueError, IndexError, KeyError):
+                continue
+
+            trades.append({
+                'File': statement.name,
+                'Account': account,
+                'Asset_Class': asset_class,
+                'Currency': currency,
+                'Symbol': values[columns['symbol']],
+                'Date_Time': trade_time,
+                'Quantity': parse_number(values[columns['quantity']], np.nan),
+                'Proceeds': parse_number(values[columns['proceeds']], np.nan),
+                'Commission': parse_number(values[columns['commission']], np.nan) if 'commission' in columns else 0.0,
+                'Basis': parse_number(values[columns['basis']], np.nan),
+                'IB_Realized': parse_number(values[columns['ib_realized']], np.nan) if 'ib_realized' in columns else 0.0,
+                'Code': values[columns['code']] if 'code' in columns else '',
+            })
+        soup.decompose()
+
+    return trades
+
+
+class LotQueue:
+    """Open lots of one position, held in parallel arrays rather than per-lot objects"""
+
+    def __init__(self, capacity=16):
+        self.quantity = np.zeros(capacity)
+        self.unit_basis = np.zeros(capacity)
+        self.opened = np.zeros(capacity, dtype='datetime64[s]')
+        self.trade_id = np.zeros(capacity, dtype=np.int64)
+        self.head = 0
+        self.tail = 0
+
+    def position(self):
+        return self.quantity[self.head:self.tail].sum()
+
+    def push(self, quantity, unit_basis, opened, trade_id):
+        if self.tail == len(self.quantity):
+            self._grow()
+        self.quantity[self.tail] = quantity
+        self.unit_basis[self.tail] = unit_basis
+        self.opened[self.tail] = opened
+        self.trade_id[self.tail] = trade_id
+        self.tail += 1
+
+    def _grow(self):
+        # Drop consumed lots at the head, then double the arrays if still full
+        live = slice(self.head, self.tail)
+        size = self.tail - self.head
+        capacity = len(self.quantity) if size < len(self.quantity) // 2 else len(self.quantity) * 2
+        for name in ('quantity', 'unit_basis', 'opened', 'trade_id'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:size] = old[live]
+            setattr(self, name, new)
+        self.head, self.tail = 0, size
+
+    def match_order(self, method, preferred_trade_ids=None):
+        """Array indexes of open lots in the order they are consumed"""
+        open_lots = self.head + np.flatnonzero(self.quantity[self.head:self.tail])
+        if method == 'lifo':
+            return open_lots[::-1]
+        if method == 'specific' and preferred_trade_ids:
+            rank = {trade_id: position for position, trade_id in enumerate(preferred_trade_ids)}
+            ranks = np.array([rank.get(trade_id, len(rank)) for trade_id in self.trade_id[open_lots]])
+            return open_lots[np.argsort(ranks, kind='stable')]
+        return open_lots
+
+    def consume(self, close_quantity, order):
+        """Take close_quantity (absolute) from lots in order
+
+        Returns the lot indexes used, the absolute quantity taken from each
+        and each lot's sign (+1 long, -1 short).
+        """
+        available = np.abs(self.quantity[order])
+        consumed_before = np.cumsum(available) - available
+        taken = np.clip(close_quantity - consumed_before, 0, available)
+        used = taken > 0
+        order, taken = order[used], taken[used]
+        lot_sign = np.sign(self.quantity[order])
+        self.quantity[order] -= lot_sign * taken
+        while self.head < self.tail and self.quantity[self.head] == 0:
+            self.head += 1
+        return order, taken, lot_sign
+
+
+class LotMatchingEngine:
+    """Recompute realized P&L from trades across many statements
+
+    Lots are matched per (account, currency, symbol) under FIFO, LIFO or
+    specific identification. Gains on lots held longer than long_term_days
+    are reported as long-term. The results can be reconciled against the
+    Realized P/L that IB reports per trade.
+    """
+
+    def __init__(self, long_term_days=365):
+        self.long_term_days = long_term_days
+        self.trade_rows = []
+
+    def add_statement(self, statement):
+        trades = extract_trades(statement)
+        self.trade_rows.extend(trades)
+        return len(trades)
+
+    def add_file(self, file_path):
+        """Add the trades of one HTML statement"""
+        count = read_statement_file(file_path, self.add_statement)
+        if count is None:
+            return 0
+        print(f"Loaded {count} trades from {file_path}")
+        return count
+
+    def add_files(self, file_paths):
+        return sum(self.add_file(file_path) for file_path in html_paths(file_paths))
+
+    def trades(self):
+        """All loaded trades in execution order"""
+        trades = pd.DataFrame(self.trade_rows)
+        if trades.empty:
+            return trades
+        trades = trades.sort_values(['Account', 'Currency', 'Symbol', 'Date_Time'], kind='stable')
+        return trades.reset_index(drop=True)
+
+    def match(self, method='fifo', lot_choices=None):
+        """Realized P&L per closing trade under the chosen lot method
+
+        lot_choices (specific ID only) maps a closing trade's index in
+        trades() to the opening trade indexes to consume first; any
+        remainder falls back to FIFO.
+        """
+        if method not in LOT_METHODS:
+            raise ValueError(f"Unknown lot method {method!r}, expected one of {LOT_METHODS}")
+        lot_choices = lot_choices or {}
+
+        trades = self.trades()
+        if trades.empty:
+            return pd.DataFrame()
+
+        quantity = trades['Quantity'].to_numpy()
+        cash = (trades['Proceeds'].fillna(0) + trades['Commission'].fillna(0)).to_numpy()
+        basis = trades['Basis'].fillna(0).to_numpy()
+        opened_at = trades['Date_Time'].to_numpy().astype('datetime64[s]')
+        codes = trades['Code'].fillna('').to_numpy()
+        long_term = np.timedelta64(self.long_term_days, 'D')
+
+        queues = {}
+        results = []
+        keys = zip(trades['Account'], trades['Currency'], trades['Symbol'])
+        for trade_id, key in enumerate(keys):
+            trade_quantity = quantity[trade_id]
+            if not trade_quantity or np.isnan(trade_quantity):
+                continue
+            queue = queues.setdefault(key, LotQueue())
+            position = queue.position()
+
+            closing = position and np.sign(position) != np.sign(trade_quantity)
+            if not closing:
+                if 'C' in codes[trade_id].split(';'):
+                    # Closes a lot opened before the loaded history
+                    results.append((trade_id, 0.0, 0.0, abs(trade_quantity)))
+                else:
+                    queue.push(trade_quantity, basis[trade_id] / trade_quantity, opened_at[trade_id], trade_id)
+                continue
+
+            close_quantity = min(abs(trade_quantity), abs(position))
+            order = queue.match_order(method, lot_choices.get(trade_id))
+            order, taken, lot_sign = queue.consume(close_quantity, order)
+
+            trade_codes = codes[trade_id].split(';')
+            cash_share = cash[trade_id] * taken / abs(trade_quantity)
+            realized = cash_share - lot_sign * taken * queue.unit_basis[order]
+            if 'A' in trade_codes:
+                # Assigned options roll their premium into the underlying; nothing is realized
+                realized = np.zeros_like(realized)
+            is_long_term = (opened_at[trade_id] - queue.opened[order]) > long_term
+
+            # A trade larger than the position flips it and the rest opens new
+            # lots, unless it is a pure close of lots from before the history
+            remainder = abs(trade_quantity) - close_quantity
+            unmatched = remainder if remainder > 0 and 'C' in trade_codes and 'O' not in trade_codes else 0.0
+            if remainder > 0 and not unmatched:
+                remainder_basis = basis[trade_id] * remainder / abs(trade_quantity)
+                remainder_cash = cash[trade_id] * remainder / abs(trade_quantity)
+                remainder_quantity = np.sign(trade_quantity) * remainder
+                unit_basis = (remainder_basis or -remainder_cash) / remainder_quantity
+                queue.push(remainder_quantity, unit_basis, opened_at[trade_id], trade_id)
+
+            results.append((trade_id, realized[~is_long_term].sum(), realized[is_long_term].sum(), unmatched))
+
+        if not results:
+            return pd.DataFrame()
+        trade_ids, short_term, long_term, unmatched = (np.array(values) for values in zip(*results))
+        matched = trades.loc[trade_ids, ['File', 'Account', 'Currency', 'Symbol', 'Date_Time', 'Quantity']]
+        matched.insert(0, 'Trade_Id', trade_ids)
+        matched['Realized_ST'] = short_term
+        matched['Realized_LT'] = long_term
+        matched['Realized_Total'] = short_term + long_term
+        matched['Unmatched_Quantity'] = unmatched
+        matched['IB_Realized'] = trades['IB_Realized'].to_numpy()[trade_ids]
+        return matched.reset_index(drop=True)
+
+    def realized_summary(self, method='fifo', lot_choices=None):
+        """Short/long-term realized P&L per account, currency and year"""
+        matched = self.match(method, lot_choices)
+        if matched.empty:
+            return matched
+        matched['Year'] = pd.to_datetime(matched['Date_Time']).dt.year
+        return matched.groupby(['Account', 'Currency', 'Year'], as_index=False)[
+            ['Realized_ST', 'Realized_LT', 'Realized_Total', 'IB_Realized']].sum()
+
+    def reconcile(self, tolerance=0.01):
+        """Compare FIFO-recomputed realized P&L with the statement's per-trade totals"""
+        matched = self.match('fifo')
+        if matched.empty:
+            return matched
+        reconciled = matched.groupby(['File', 'Account', 'Currency'], as_index=False)[
+            ['Realized_Total', 'IB_Realized', 'Unmatched_Quantity']].sum()
+        reconciled['Difference'] = (reconciled['Realized_Total'] - reconciled['IB_Realized']).round(2)
+        reconciled['Reconciled'] = (reconciled['Difference'].abs() <= tolerance) & \
+            (reconciled['Unmatched_Quantity'] == 0)
+        return reconciled
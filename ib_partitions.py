@@ -0,0 +1,165 @@
+import os
+import re
+import json
+import hashlib
+from datetime import datetime
+from ib_statement_reader import write_json_atomic
+
+PARTITION_SCHEMES = ('year', 'account_year')
+UNSAFE_NAME_CHARACTERS = re.compile(r'[^A-Za-z0-9_-]+')
+
+
+def partition_key(row, by='year'):
+    if by == 'account_year':
+        return f"{UNSAFE_NAME_CHARACTERS.sub('_', str(row['Account']))}_{row['Year']}"
+    return str(row['Year'])
+
+
+def _canonical_value(value):
+    # 0 and 0.0 are the same amount; which one a row holds depends on the batch's column dtypes
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+def content_hash(rows):
+    """Order-independent hash of a partition's rows"""
+    canonical = sorted(json.dumps({column: _canonical_value(value) for column, value in row.items()},
+                                  sort_keys=True, default=str) for row in rows)
+    return hashlib.sha256('\n'.join(canonical).encode('utf-8')).hexdigest()
+
+
+class PartitionManifest:
+    """Content hash and member statements of every output partition, kept beside the workbooks
+
+    The manifest itself holds only hashes, per-partition totals and which
+    partitions each statement contributed to; each partition's rows live in
+    their own file next to its workbook. A run only has to supply the
+    statements it processed: the partitions those statements touch are read
+    back, merged and re-hashed, and only partitions whose content changed
+    (or whose workbook is missing) are rewritten. Untouched history is
+    never loaded or re-serialized.
+    """
+
+    def __init__(self, output_dir, by='year'):
+        if by not in PARTITION_SCHEMES:
+            raise ValueError(f"Unknown partition scheme {by!r}, expected one of {PARTITION_SCHEMES}")
+        self.output_dir = output_dir
+        self.by = by
+        self.path = os.path.join(output_dir, f"_partitions_{by}.json")
+        # partition -> {'hash', 'rows', 'statements', 'total_realized', 'updated'}
+        self.partitions = {}
+        # statement file -> partitions it has rows in
+        self.files = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                stored = json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"Error reading partition manifest {self.path}: {e}")
+            return
+        self.partitions = stored['partitions']
+        self.files = stored['files']
+
+    def save(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        write_json_atomic(self.path, {'partitions': self.partitions, 'files': self.files})
+
+    def workbook_path(self, key):
+        return os.path.join(self.output_dir, f"IB_PnL_{key}.xlsx")
+
+    def rows_path(self, key):
+        return os.path.join(self.output_dir, f"IB_PnL_{key}.rows.json")
+
+    def partition_rows(self, key):
+        """Stored rows of one partition ([] if it has none)"""
+        if key not in self.partitions or not os.path.exists(self.rows_path(key)):
+            return []
+        with open(self.rows_path(key), 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+    def _store(self, key, rows, digest, updated):
+        os.makedirs(self.output_dir, exist_ok=True)
+        write_json_atomic(self.rows_path(key), rows, default=str)
+        statements = sorted({row['File'] for row in rows})
+        for file_name in statements:
+            keys = self.files.setdefault(file_name, [])
+            if key not in keys:
+                keys.append(key)
+        self.partitions[key] = {
+            'hash': digest,
+            'rows': len(rows),
+            'statements': len(statements),
+            'total_realized': sum(float(row.get('Total_Realized') or 0) for row in rows),
+            'updated': updated,
+        }
+
+    def _drop(self, key):
+        self.partitions.pop(key, None)
+        if os.path.exists(self.rows_path(key)):
+            os.remove(self.rows_path(key))
+
+    def update(self, rows, removed_files=()):
+        """Merge this run's rows in; returns {partition: rows} for partitions that need (re)writing
+
+        Statements in removed_files are dropped along with any they replace.
+        """
+        files = {row['File'] for row in rows} | set(removed_files)
+        incoming = {}
+        for row in rows:
+            incoming.setdefault(partition_key(row, self.by), []).append(row)
+        touched = set(incoming)
+        for file_name in files:
+            touched.update(self.files.pop(file_name, []))
+
+        changed = {}
+        for key in sorted(touched):
+            stored = self.partition_rows(key)
+            merged = [row for row in stored if row['File'] not in files] + incoming.get(key, [])
+            # Round-trip through JSON so hashes compare equal to what is stored
+            merged = json.loads(json.dumps(merged, default=str))
+            entry = self.partitions.get(key)
+            if not merged:
+                # An emptied partition is returned with no rows so its workbook gets removed
+                if entry is not None:
+                    self._drop(key)
+                    changed[key] = []
+                continue
+
+            digest = content_hash(merged)
+            if entry is None or entry['hash'] != digest:
+                self._store(key, merged, digest, datetime.now().isoformat(timespec='seconds'))
+                changed[key] = merged
+            else:
+                for file_name in {row['File'] for row in merged}:
+                    keys = self.files.setdefault(file_name, [])
+                    if key not in keys:
+                        keys.append(key)
+                if not os.path.exists(self.workbook_path(key)):
+                    changed[key] = merged
+
+        # Workbooks deleted by hand are rebuilt from their stored rows
+        for key in self.partitions:
+            if key not in touched and not os.path.exists(self.workbook_path(key)):
+                changed[key] = self.partition_rows(key)
+        return changed
+
+    def index_rows(self):
+        """One line per partition for the index workbook"""
+        index = []
+        for key in sorted(self.partitions):
+            entry = self.partitions[key]
+            index.append({
+                'Partition': key,
+                'Workbook': os.path.basename(self.workbook_path(key)),
+                'Rows': entry['rows'],
+                'Statements': entry['statements'],
+                'Total_Realized': entry['total_realized'],
+                'Content_Hash': entry['hash'][:16],
+                'Updated': entry['updated'],
+            })
+        return index
@@ -0,0 +1,111 @@
+import re
+
+# Each pattern is matched against a single whitespace-separated token, never the whole text
+ACCOUNT_TOKEN = re.compile(r'SGDU\*\*\*\d+|U\*\*\*\d+F?|U\d+F?')
+INFO_ACCOUNT_TOKEN = re.compile(r'[UF\*\d]+F?')
+NAME_WORD = re.compile(r'[A-Za-z]+')
+AMOUNT_TOKEN = re.compile(r'[\d,]+\.?\d*')
+PERCENT_TOKEN = re.compile(r'[-\d.]+%')
+DATE_RANGE = re.compile(r'(\w+ \d+, \d+) - (\w+ \d+, \d+)')
+PERIOD_HEADINGS = ('Activity Summary', 'Activity Statement')
+# 'November 1, 2021 - November 30, 2021' is seven tokens
+DATE_RANGE_TOKENS = 7
+
+
+def tokenize(text):
+    """Whitespace-separated tokens of the text, with the line number of each"""
+    tokens = []
+    lines = []
+    for line_number, line in enumerate(text.splitlines()):
+        words = line.split()
+        tokens.extend(words)
+        lines.extend([line_number] * len(words))
+    return tokens, lines
+
+
+def _summary_row(tokens, start):
+    """Match 'account name... amount amount pct%' at tokens[start]
+
+    Returns (account, name, next index), or None.
+    """
+    position = start + 1
+    while position < len(tokens) and NAME_WORD.fullmatch(tokens[position]):
+        position += 1
+    if (position > start + 1 and position + 3 <= len(tokens)
+            and AMOUNT_TOKEN.fullmatch(tokens[position])
+            and AMOUNT_TOKEN.fullmatch(tokens[position + 1])
+            and PERCENT_TOKEN.fullmatch(tokens[position + 2])):
+        return tokens[start], ' '.join(tokens[start + 1:position]), position + 3
+    return None
+
+
+def _info_name(tokens, lines, start):
+    """Name words after the 'Name' key at tokens[start]
+
+    The value may start on the key's line or the next one, and ends with
+    the line it starts on.
+    """
+    position = start + 1
+    words = []
+    while (position < len(tokens) and NAME_WORD.fullmatch(tokens[position])
+           and (not words or lines[position] == lines[position - 1])):
+        words.append(tokens[position])
+        position += 1
+    return ' '.join(words) or None
+
+
+def scan_statement_text(text):
+    """Walk the statement text once as a single token stream
+
+    Returns {'period': {heading: (start, end)}, 'summary_accounts': [...],
+    'info_accounts': [...]}, where the account lists hold
+    {'account_number', 'name'} dicts from the account summary rows and the
+    Account Information blocks respectively. Matching works on tokens, so
+    a heading, a summary row or a key/value pair may be broken over
+    several lines (PDF text often has one cell per line).
+    """
+    tokens, lines = tokenize(text)
+    periods = {}
+    summary_accounts = []
+    info_accounts = []
+    info_block = None
+
+    position = 0
+    while position < len(tokens):
+        token = tokens[position]
+        following = tokens[position + 1] if position + 1 < len(tokens) else None
+
+        # Period: 'Activity Summary/Statement <start> - <end>'
+        heading = f"{token} {following}"
+        if heading in PERIOD_HEADINGS and heading not in periods:
+            match = DATE_RANGE.match(' '.join(tokens[position + 2:position + 2 + DATE_RANGE_TOKENS]))
+            if match:
+                periods[heading] = match.groups()
+
+        # Account Information blocks: 'Account <number>' and 'Name <name>' pairs
+        if token == 'Account' and following == 'Information':
+            info_block = {'account_number': None, 'name': None}
+            info_accounts.append(info_block)
+            position += 2
+            continue
+        if info_block is not None:
+            if (token == 'Account' and info_block['account_number'] is None
+                    and following is not None and INFO_ACCOUNT_TOKEN.fullmatch(following)):
+                info_block['account_number'] = following
+            elif token == 'Name' and info_block['name'] is None:
+                info_block['name'] = _info_name(tokens, lines, position)
+
+        # Account summary rows
+        if ACCOUNT_TOKEN.fullmatch(token):
+            row = _summary_row(tokens, position)
+            if row:
+                account, name, position = row
+                summary_accounts.append({'account_number': account, 'name': name})
+                continue
+        position += 1
+
+    return {
+        'period': periods,
+        'summary_accounts': summary_accounts,
+        'info_accounts': [block for block in info_accounts if block['account_number'] and block['name']],
+    }
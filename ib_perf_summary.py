@@ -0,0 +1,214 @@
+import re
+from ib_layouts import ParsePlanCache
+from ib_statement_fields import parse_number
+
+# Every asset-class label IB has used in the performance summary, mapped to
+# the row column prefix it rolls up into. Adding a class is one entry here.
+ASSET_CLASS_COLUMNS = {
+    'Stocks': 'Stocks',
+    'Equity and Index Options': 'Options',
+    'Options': 'Options',
+    'Futures': 'Futures',
+    'Options On Futures': 'Futures',
+    'Futures Options': 'Futures',
+    'Forex': 'Forex',
+    'Bonds': 'Bonds',
+    'Treasury Bills': 'Bonds',
+    'CFDs': 'CFDs',
+    'Forex CFDs': 'CFDs',
+    'Warrants': 'Warrants',
+    '(All Assets)': 'Total',
+}
+ASSET_COLUMNS = list(dict.fromkeys(ASSET_CLASS_COLUMNS.values()))
+
+# Header cells of the performance summary; each block of these repeats
+# for Realized and Unrealized, followed by one overall Total
+MEASURE_NAMES = {
+    'Cost Adj.': 'Cost_Adj',
+    'S/T Profit': 'ST_Profit',
+    'S/T Loss': 'ST_Loss',
+    'L/T Profit': 'LT_Profit',
+    'L/T Loss': 'LT_Loss',
+}
+MEASURE_GROUPS = ('Realized', 'Unrealized', 'Combined')
+STANDARD_HEADER = ('Symbol', 'Cost Adj.', 'S/T Profit', 'S/T Loss', 'L/T Profit', 'L/T Loss', 'Total',
+                   'S/T Profit', 'S/T Loss', 'L/T Profit', 'L/T Loss', 'Total', 'Total')
+
+# Header signatures (see ib_layouts.header_signature) of the layouts checked against real statements
+KNOWN_LAYOUTS = {
+    '58a866ee4101': 'Symbol, realized and unrealized blocks, overall Total (2013 onward)',
+    '8744b0584ef9': 'The same with a trailing Code column (2021 onward)',
+}
+# Longest first, so multi-word PDF header names win over their prefixes
+HEADER_NAMES = sorted(set(STANDARD_HEADER) | {'Code'}, key=len, reverse=True)
+
+# Row columns derived from the summary: realized and unrealized per asset class
+PNL_ROW_COLUMNS = [f"{asset}_{group}" for group in MEASURE_GROUPS[:2] for asset in ASSET_COLUMNS]
+
+# A numeric cell in PDF text: a number or a dash placeholder
+VALUE_PATTERN = re.compile(r'^(-?[\d,]*\.?\d+|-+)$')
+
+
+def split_header_line(line):
+    """Header names of a PDF text header line; unrecognised words are kept as their own cells"""
+    cells = []
+    rest = line.strip()
+    while rest:
+        name = next((name for name in HEADER_NAMES
+                     if rest.startswith(name) and rest[len(name):len(name) + 1] in ('', ' ')), None)
+        if name is None:
+            name = rest.split()[0]
+        cells.append(name)
+        rest = rest[len(name):].lstrip()
+    return tuple(cells)
+
+
+def _missing_realized_total(plan):
+    measures = plan if isinstance(plan, dict) else [measure for _, measure in plan]
+    return None if 'Realized' in measures else 'no realized Total column'
+
+
+class PerfSummaryMatcher:
+    """Map performance-summary subtotal rows to asset-class columns in one lookup
+
+    'Total <class>' labels (2021+) and bare 'Total' rows under a class
+    heading (2013) are both resolved through ASSET_CLASS_COLUMNS. Each
+    header layout is compiled once per header signature into a list of
+    (cell index, measure) pairs for HTML, or value offsets for PDF text,
+    so every realized and unrealized column is captured by name. Layouts
+    not in KNOWN_LAYOUTS are flagged (see layout_warnings).
+    """
+
+    def __init__(self, asset_class_columns=None):
+        self.asset_class_columns = dict(asset_class_columns or ASSET_CLASS_COLUMNS)
+        self.total_labels = {f"Total {label}": column for label, column in self.asset_class_columns.items()}
+        self.layouts = ParsePlanCache('Performance Summary', self._compile_cell_plan, KNOWN_LAYOUTS,
+                                      _missing_realized_total, STANDARD_HEADER)
+        self.pdf_layouts = ParsePlanCache('Performance Summary (PDF)', self._compile_offset_plan, KNOWN_LAYOUTS,
+                                          _missing_realized_total, STANDARD_HEADER)
+
+    def set_source(self, source):
+        """Name the statement being parsed, for layout warnings"""
+        self.layouts.source = source
+        self.pdf_layouts.source = source
+
+    @staticmethod
+    def _compile_cell_plan(header):
+        plan = []
+        group = 0
+        for index, cell in enumerate(header):
+            if cell == 'Total':
+                plan.append((index, MEASURE_GROUPS[min(group, len(MEASURE_GROUPS) - 1)]))
+                group += 1
+            elif cell in MEASURE_NAMES:
+                measure = MEASURE_NAMES[cell]
+                plan.append((index, measure if cell == 'Cost Adj.' else f"{MEASURE_GROUPS[group]}_{measure}"))
+        return plan
+
+    @classmethod
+    def _compile_offset_plan(cls, header):
+        # PDF text drops the cell grid, so measures are counted back from the last value
+        plan = cls._compile_cell_plan(header)
+        return {measure: len(plan) - position for position, (_, measure) in enumerate(plan)}
+
+    def column_plan(self, header_cells):
+        """[(cell index, measure)] for a header row, compiled once per layout"""
+        return self.layouts.plan(header_cells)
+
+    def value_offsets(self, header_cells):
+        """{measure: position from the right} for a PDF header, compiled once per layout"""
+        return self.pdf_layouts.plan(header_cells)
+
+    def pdf_header(self, lines):
+        """Header cells of a PDF summary section; the standard layout (flagged) if none is found
+
+        A header line that yields no usable plan (wrapped, or one cell per
+        line) is flagged by value_offsets, which then uses the standard
+        layout too.
+        """
+        for line in lines:
+            if line.strip().startswith('Symbol'):
+                return split_header_line(line)
+        self.pdf_layouts.flag('no header', STANDARD_HEADER, 'header not found, standard layout assumed')
+        return STANDARD_HEADER
+
+    @staticmethod
+    def pdf_value(line, label, offsets, measure='Realized'):
+        """One measure from a PDF subtotal line (None if the line is too short or not numeric)"""
+        values = line[len(label):].split()
+        # Trailing text columns such as Code hold no measures
+        while values and not VALUE_PATTERN.match(values[-1]):
+            values.pop()
+        offset = offsets.get(measure)
+        if offset is None or len(values) < offset:
+            return None
+        return parse_number(values[-offset])
+
+    def layout_warnings(self):
+        """Unknown or unusable header layouts seen so far, one row per signature"""
+        return self.layouts.warning_rows() + self.pdf_layouts.warning_rows()
+
+    def warning_counts(self):
+        """Snapshot of the layout warning counts, for layout_warnings_since"""
+        return {(warning['Table'], warning['Signature']): warning['Count'] for warning in self.layout_warnings()}
+
+    def layout_warnings_since(self, counts):
+        """Layout warnings raised after a warning_counts snapshot, e.g. by one statement"""
+        warnings = []
+        for warning in self.layout_warnings():
+            count = warning['Count'] - counts.get((warning['Table'], warning['Signature']), 0)
+            if count > 0:
+                warnings.append(dict(warning, Count=count))
+        return warnings
+
+    def merge_layout_warnings(self, warning_rows):
+        """Add layout warnings collected by another matcher (worker processes, shards)"""
+        self.layouts.merge(warning_rows)
+        self.pdf_layouts.merge(warning_rows)
+
+    def match_label(self, first_cell, current_class=None):
+        """Target column for a row label, or None for symbol rows"""
+        column = self.total_labels.get(first_cell)
+        if column is None and first_cell == 'Total' and current_class:
+            column = self.asset_class_columns.get(current_class)
+        return column
+
+    def match_rows(self, rows):
+        """{column: {measure: value}} from the <tr> elements of one summary table"""
+        plan = self.column_plan(STANDARD_HEADER)
+        current_class = None
+        matched = {}
+        for row in rows:
+            headers = row.find_all('th')
+            if headers:
+                header_cells = [cell.get_text().strip() for cell in headers]
+                # Skip the 'Realized' / 'Unrealized' banner above the column names
+                if len(header_cells) > 2 and not set(header_cells) <= set(MEASURE_GROUPS) | {''}:
+                    plan = self.column_plan(header_cells)
+                continue
+
+            cells = row.find_all('td')
+            if not cells:
+                continue
+            first_cell = cells[0].get_text().strip()
+            if len(cells) == 1:
+                if first_cell:
+                    current_class = first_cell
+                continue
+
+            column = self.match_label(first_cell, current_class)
+            if column is None:
+                continue
+            measures = matched.setdefault(column, {})
+            for index, measure in plan:
+                if index < len(cells):
+                    value = parse_number(cells[index].get_text())
+                    if value is not None:
+                        measures[measure] = measures.get(measure, 0) + value
+        return matched
+
+
+def pnl_row_values(matched):
+    """Realized/unrealized totals per asset class, shaped as row columns"""
+    return {f"{asset}_{group}": matched.get(asset, {}).get(group, 0)
+            for group in MEASURE_GROUPS[:2] for asset in ASSET_COLUMNS}
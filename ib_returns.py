@@ -0,0 +1,421 @@
+import re
+import numpy as np
+import pandas as pd
+from ib_statement_reader import read_statement_file, html_paths
+from ib_statement_fields import CURRENCY_PATTERN, parse_number, parse_statement_date, period_bounds, base_currencies
+from ib_fragment_cache import section_rows
+
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}')
+ONE_DAY = np.timedelta64(1, 'D')
+
+# Cash flow sections: section id prefix -> (flow kind, amount column names)
+FLOW_SECTIONS = {
+    'tblCombDepWith_': ('Deposit/Withdrawal', ('Amount',)),
+    'tblDepositsWithdrawals_': ('Deposit/Withdrawal', ('Amount',)),
+    'tblAccountTransfers_': ('Transfer', ('Cash Amount', 'Amount')),
+}
+# NAV sections: tblNAV (2021+) and tblEquitySummary (2013)
+NAV_SECTIONS = ('tblNAV_', 'tblEquitySummary_')
+# 2013 NAV chart bars carry their data in the title: "Long Cash as of 2013-11-01: 31,351.59"
+EQUITY_POINT_PATTERN = re.compile(r'title="((?:Long|Short) [^"]+?) as of (\d{4}-\d{2}-\d{2}): (-?[\d,]+\.?\d*)"')
+
+
+def _date(text):
+    date = parse_statement_date(text)
+    return np.datetime64(date, 'D') if date else None
+
+
+def _account(section_id, prefix):
+    return section_id[len(prefix):-len('Body')]
+
+
+def statement_period(statement):
+    """(start, end) dates of a statement from its <title>"""
+    return tuple(np.datetime64(date, 'D') if date else None for date in period_bounds(statement.title()))
+
+
+def extract_cash_flows(statement):
+    """Dated deposits, withdrawals and transfers per account
+
+    Amounts are converted to the account's base currency with the ratio of
+    each currency block's 'Total in <base>' row to its 'Total' row.
+    """
+    bases = base_currencies(statement)
+    flows = []
+    for section_id in statement.sections():
+        prefix = next((prefix for prefix in FLOW_SECTIONS if section_id.startswith(prefix)), None)
+        if prefix is None or not section_id.endswith('Body'):
+            continue
+        kind, amount_names = FLOW_SECTIONS[prefix]
+        account = _account(section_id, prefix)
+        base = bases.get(account)
+
+        columns = {}
+        currency = None
+        block = []
+        block_total = None
+        for is_header, cells in section_rows(statement, section_id):
+            if is_header:
+                columns = {cell: index for index, cell in enumerate(cells)}
+                continue
+            if len(cells) == 1:
+                if CURRENCY_PATTERN.match(cells[0]):
+                    currency, block, block_total = cells[0], [], None
+                continue
+            # 'Total in <base>' labels may wrap or use non-breaking spaces
+            label = ' '.join(cells[0].split())
+            if label == 'Total':
+                block_total = parse_number(cells[1])
+                continue
+            if label.startswith('Total in '):
+                total_in_base = parse_number(cells[1])
+                if label.split()[-1] == base and block_total and total_in_base is not None:
+                    for flow in block:
+                        flow['Base_Amount'] = flow['Amount'] * total_in_base / block_total
+                continue
+
+            date_column = columns.get('Date')
+            amount_column = next((columns[name] for name in amount_names if name in columns), None)
+            if date_column is None or amount_column is None or len(cells) <= max(date_column, amount_column):
+                continue
+            if not DATE_PATTERN.match(cells[date_column]):
+                continue
+            amount = parse_number(cells[amount_column])
+            if amount is None:
+                continue
+            flow = {
+                'File': statement.name,
+                'Account': account,
+                'Date': np.datetime64(cells[date_column][:10], 'D'),
+                'Kind': kind,
+                'Currency': currency,
+                'Amount': amount,
+                'Base_Amount': amount if currency == base else np.nan,
+                'Description': cells[columns['Description']] if 'Description' in columns else '',
+            }
+            block.append(flow)
+            flows.append(flow)
+    return flows
+
+
+def extract_nav(statement):
+    """Opening and closing NAV per account (plus IB's own TWR when reported)"""
+    period_start, period_end = statement_period(statement)
+    navs = []
+    for section_id in statement.sections():
+        prefix = next((prefix for prefix in NAV_SECTIONS if section_id.startswith(prefix)), None)
+        if prefix is None or not section_id.endswith('Body'):
+            continue
+
+        # 2021+ headers name the two dates; 2013 says Prior/Current Period
+        start_date = period_start - ONE_DAY if period_start is not None else None
+        end_date = period_end
+        start_nav = end_nav = ib_twr = None
+        for is_header, cells in section_rows(statement, section_id):
+            if is_header:
+                if len(cells) >= 3 and _date(cells[1]) is not None and _date(cells[2]) is not None:
+                    start_date, end_date = _date(cells[1]), _date(cells[2])
+                continue
+            if cells and cells[0] == 'Total' and len(cells) >= 5 and start_nav is None:
+                start_nav, end_nav = parse_number(cells[1]), parse_number(cells[4])
+            elif len(cells) >= 2 and cells[0] == 'Time Weighted Rate of Return':
+                value = parse_number(cells[1])
+                ib_twr = value / 100 if value is not None else None
+
+        if start_nav is None or end_nav is None or start_date is None or end_date is None:
+            continue
+        navs.append({
+            'File': statement.name,
+            'Account': _account(section_id, prefix),
+            'Start_Date': start_date,
+            'End_Date': end_date,
+            'Start_NAV': start_nav,
+            'End_NAV': end_nav,
+            'IB_TWR': ib_twr,
+        })
+    return navs
+
+
+def extract_equity_value_series(statement):
+    """Daily NAV components from the 2013 tblEquityValueTimeSeries charts
+
+    Yields one point per component and day ('Long Cash', 'Short Options', ...)
+    plus their sum as 'NAV'.
+    """
+    points = []
+    for section_id in statement.sections():
+        if not (section_id.startswith('tblEquityValueTimeSeries_') and section_id.endswith('Body')):
+            continue
+        account = _account(section_id, 'tblEquityValueTimeSeries_')
+        totals = {}
+        for match in EQUITY_POINT_PATTERN.finditer(statement.section_html(section_id)):
+            series, date, value = match.groups()
+            value = float(value.replace(',', ''))
+            date = np.datetime64(date, 'D')
+            points.append({'File': statement.name, 'Account': account, 'Date': date,
+                           'Series': series, 'Value': value})
+            totals[date] = totals.get(date, 0.0) + value
+        points.extend({'File': statement.name, 'Account': account, 'Date': date, 'Series': 'NAV', 'Value': value}
+                      for date, value in totals.items())
+    return points
+
+
+def extract_position_value_changes(statement):
+    """2013 tblChangeInPositionValue rows per asset class, dated at the period end
+
+    Only the base currency summary is kept, so values add up across classes.
+    """
+    _, period_end = statement_period(statement)
+    points = []
+    for section_id in statement.sections():
+        if not (section_id.startswith('tblChangeInPositionValue_') and section_id.endswith('Body')):
+            continue
+        account = _account(section_id, 'tblChangeInPositionValue_')
+        asset_class = None
+        in_base = False
+        for is_header, cells in section_rows(statement, section_id):
+            if is_header or not cells:
+                continue
+            if len(cells) == 1:
+                if cells[0] == 'Base Currency Summary':
+                    in_base = True
+                elif CURRENCY_PATTERN.match(cells[0]):
+                    in_base = False
+                elif cells[0]:
+                    asset_class, in_base = cells[0], False
+                continue
+            value = parse_number(cells[1])
+            if in_base and value is not None and period_end is not None:
+                points.append({'File': statement.name, 'Account': account, 'Date': period_end,
+                               'Series': f"{asset_class}: {cells[0]}", 'Value': value})
+    return points
+
+
+class TimeSeriesStore:
+    """Per-account dated values in long form (Account, Date, Series, Value)
+
+    Every layout feeds the same store: statement NAV at each period's start
+    and end, the 2013 daily NAV charts and the 2013 change in position
+    value tables. All of them come from the statement's section index, so
+    the document is traversed only once.
+    """
+
+    def __init__(self):
+        self.rows = []
+
+    def add_statement(self, statement):
+        points = []
+        for nav in extract_nav(statement):
+            for date, value in ((nav['Start_Date'], nav['Start_NAV']), (nav['End_Date'], nav['End_NAV'])):
+                points.append({'File': statement.name, 'Account': nav['Account'], 'Date': date,
+                               'Series': 'NAV', 'Value': value})
+        points.extend(extract_equity_value_series(statement))
+        points.extend(extract_position_value_changes(statement))
+        self.rows.extend(points)
+        return len(points)
+
+    def frame(self, account=None, series=None):
+        """Stored points, one per (account, date, series), latest statement winning"""
+        frame = pd.DataFrame(self.rows, columns=['File', 'Account', 'Date', 'Series', 'Value'])
+        if frame.empty:
+            return frame
+        if account is not None:
+            frame = frame[frame['Account'] == account]
+        if series is not None:
+            frame = frame[frame['Series'].isin([series] if isinstance(series, str) else series)]
+        frame = frame.drop_duplicates(['Account', 'Date', 'Series'], keep='last')
+        return frame.sort_values(['Account', 'Series', 'Date']).reset_index(drop=True)
+
+    def wide(self, account):
+        """Date x Series table for one account, ready for charting"""
+        frame = self.frame(account)
+        if frame.empty:
+            return frame
+        return frame.pivot(index='Date', columns='Series', values='Value').sort_index()
+
+
+class ReturnsEngine:
+    """Time- and money-weighted returns per account from extracted NAV and flows
+
+    Each statement period becomes one Modified Dietz link. Chained growth
+    factors and prefix sums of the flows are precomputed per account, so
+    any range of whole periods is answered with two binary searches and a
+    few array reads instead of re-aggregating the history.
+
+    Periods must follow on from each other: where a period does not start
+    at the previous period's end (missing statements), the NAV and flows
+    in between are unknown, so ranges spanning that gap return NaN.
+    """
+
+    def __init__(self):
+        self.nav_rows = []
+        self.flow_rows = []
+        self._accounts = None
+
+    def add_statement(self, statement):
+        navs = extract_nav(statement)
+        flows = extract_cash_flows(statement)
+        self.nav_rows.extend(navs)
+        self.flow_rows.extend(flows)
+        self._accounts = None
+        return len(navs), len(flows)
+
+    def add_file(self, file_path):
+        """Add the NAV and cash flows of one HTML statement"""
+        counts = read_statement_file(file_path, self.add_statement)
+        if counts is None:
+            return 0
+        navs, flows = counts
+        print(f"Loaded {navs} NAV periods and {flows} cash flows from {file_path}")
+        return navs
+
+    def add_files(self, file_paths):
+        return sum(self.add_file(file_path) for file_path in html_paths(file_paths))
+
+    def nav(self):
+        """One row per account and period; a re-issued statement replaces the earlier copy"""
+        nav = pd.DataFrame(self.nav_rows)
+        if nav.empty:
+            return nav
+        nav = nav.drop_duplicates(['Account', 'Start_Date', 'End_Date'], keep='last')
+        return nav.sort_values(['Account', 'End_Date']).reset_index(drop=True)
+
+    def flows(self):
+        flows = pd.DataFrame(self.flow_rows)
+        if flows.empty:
+            return flows
+        # Statements loaded twice would double every flow
+        flows = flows.drop_duplicates(['Account', 'Date', 'Kind', 'Currency', 'Amount', 'Description'], keep='last')
+        return flows.sort_values(['Account', 'Date']).reset_index(drop=True)
+
+    def build(self):
+        """Precompute per-account links, chained growth and flow prefix sums"""
+        nav = self.nav()
+        flows = self.flows()
+        self._accounts = {}
+        if nav.empty:
+            return self._accounts
+
+        for account, periods in nav.groupby('Account', sort=False):
+            start = periods['Start_Date'].to_numpy().astype('datetime64[D]')
+            end = periods['End_Date'].to_numpy().astype('datetime64[D]')
+            start_nav = periods['Start_NAV'].to_numpy(dtype=float)
+            end_nav = periods['End_NAV'].to_numpy(dtype=float)
+
+            if flows.empty:
+                flow_dates = np.array([], dtype='datetime64[D]')
+                flow_amounts = np.array([])
+            else:
+                account_flows = flows[flows['Account'] == account]
+                unconverted = account_flows['Base_Amount'].isna()
+                if unconverted.any():
+                    print(f"Ignoring {unconverted.sum()} {account} cash flows with no base-currency amount")
+                    account_flows = account_flows[~unconverted]
+                flow_dates = account_flows['Date'].to_numpy().astype('datetime64[D]')
+                flow_amounts = account_flows['Base_Amount'].to_numpy(dtype=float)
+            flow_days = (flow_dates - np.datetime64('1970-01-01', 'D')).astype(float)
+            cumulative_flow = np.concatenate([[0.0], np.cumsum(flow_amounts)])
+            cumulative_flow_days = np.concatenate([[0.0], np.cumsum(flow_amounts * flow_days)])
+
+            # Flows dated after a period's start day and up to its end belong to it
+            first = np.searchsorted(flow_dates, start, side='right')
+            last = np.searchsorted(flow_dates, end, side='right')
+            end_days = (end - np.datetime64('1970-01-01', 'D')).astype(float)
+            length = np.maximum((end - start).astype(float), 1.0)
+            net_flow = cumulative_flow[last] - cumulative_flow[first]
+            weighted_flow = (end_days * net_flow - (cumulative_flow_days[last] - cumulative_flow_days[first])) / length
+
+            denominator = start_nav + weighted_flow
+            link = np.divide(end_nav - start_nav - net_flow, denominator,
+                             out=np.zeros_like(denominator), where=denominator != 0)
+
+            # A period that does not start where the previous one ended follows a gap
+            after_gap = np.concatenate([[False], start[1:] != end[:-1]])
+            for index in np.flatnonzero(after_gap):
+                print(f"No statements for {account} between {end[index - 1]} and {start[index]}; "
+                      f"returns are not chained across the gap")
+
+            self._accounts[account] = {
+                'start': start,
+                'end': end,
+                'after_gap': after_gap,
+                # gaps[i]: gaps before period i, so a range of periods is checked with two reads
+                'gaps': np.cumsum(after_gap),
+                'start_nav': start_nav,
+                'end_nav': end_nav,
+                'link': link,
+                'growth': np.concatenate([[1.0], np.cumprod(1 + link)]),
+                'flow_dates': flow_dates,
+                'cumulative_flow': cumulative_flow,
+                'cumulative_flow_days': cumulative_flow_days,
+                'ib_twr': periods['IB_TWR'].to_numpy(dtype=float),
+            }
+        return self._accounts
+
+    def _periods(self, account, start_date=None, end_date=None):
+        if self._accounts is None:
+            self.build()
+        series = self._accounts.get(account)
+        if series is None:
+            return None, 0, 0
+        # Whole periods ending within [start_date, end_date]
+        first = np.searchsorted(series['end'], np.datetime64(start_date, 'D'), side='left') if start_date else 0
+        last = np.searchsorted(series['end'], np.datetime64(end_date, 'D'), side='right') if end_date \
+            else len(series['end'])
+        if last > first and series['gaps'][last - 1] != series['gaps'][first]:
+            # Some period in the range does not follow on from the one before
+            return series, 0, 0
+        return series, first, last
+
+    def time_weighted_return(self, account, start_date=None, end_date=None):
+        """Chained return of the periods ending within the range (NaN if none, or if they are not contiguous)"""
+        series, first, last = self._periods(account, start_date, end_date)
+        if series is None or last <= first:
+            return float('nan')
+        return series['growth'][last] / series['growth'][first] - 1
+
+    def money_weighted_return(self, account, start_date=None, end_date=None):
+        """Modified Dietz return over the range, weighting each flow by its time invested
+
+        NaN if no period ends within the range or the periods are not contiguous.
+        """
+        series, first, last = self._periods(account, start_date, end_date)
+        if series is None or last <= first:
+            return float('nan')
+        begin, finish = series['start'][first], series['end'][last - 1]
+        start_nav, end_nav = series['start_nav'][first], series['end_nav'][last - 1]
+
+        flow_first = np.searchsorted(series['flow_dates'], begin, side='right')
+        flow_last = np.searchsorted(series['flow_dates'], finish, side='right')
+        net_flow = series['cumulative_flow'][flow_last] - series['cumulative_flow'][flow_first]
+        flow_days = series['cumulative_flow_days'][flow_last] - series['cumulative_flow_days'][flow_first]
+        finish_days = float((finish - np.datetime64('1970-01-01', 'D')).astype(float))
+        length = max(float((finish - begin).astype(float)), 1.0)
+        denominator = start_nav + (finish_days * net_flow - flow_days) / length
+        if denominator == 0:
+            return float('nan')
+        return (end_nav - start_nav - net_flow) / denominator
+
+    def returns(self):
+        """Per-period links next to IB's reported TWR for reconciliation
+
+        After_Gap marks periods that do not follow on from the previous one;
+        Cumulative_Return is chained from the first period after the last gap.
+        """
+        if self._accounts is None:
+            self.build()
+        frames = []
+        for account, series in self._accounts.items():
+            run_start = np.maximum.accumulate(np.where(series['after_gap'], np.arange(len(series['end'])), 0))
+            frames.append(pd.DataFrame({
+                'Account': account,
+                'Start_Date': series['start'],
+                'End_Date': series['end'],
+                'Start_NAV': series['start_nav'],
+                'End_NAV': series['end_nav'],
+                'After_Gap': series['after_gap'],
+                'Return': series['link'],
+                'Cumulative_Return': series['growth'][1:] / series['growth'][run_start] - 1,
+                'IB_TWR': series['ib_twr'],
+            }))
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
@@ -0,0 +1,80 @@
+import os
+import json
+from datetime import datetime
+
+
+class RunJournal:
+    """Append-only checkpoint journal of the statements a batch run has finished
+
+    Each completed statement is appended as one JSON line holding its rows
+    and fsync'd before the run moves on, so a crash or kill loses at most
+    the statement in progress. A line torn by a crash mid-write is dropped
+    on load. Reopen with resume=True to skip finished statements.
+    Layout warnings raised by a statement can be journalled with its rows,
+    so a resumed run still reports them.
+    """
+
+    def __init__(self, path="IB_PnL_Run.journal", resume=False):
+        self.path = path
+        # statement name -> rows, in completion order
+        self.completed = {}
+        # statement name -> layout warning rows it raised (only statements that raised any)
+        self.layout_warnings = {}
+        if resume:
+            self.load()
+        elif os.path.exists(path):
+            os.remove(path)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        good_bytes = 0
+        with open(self.path, 'rb') as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                self.completed[entry['file']] = entry['rows']
+                if entry.get('layout_warnings'):
+                    self.layout_warnings[entry['file']] = entry['layout_warnings']
+                good_bytes += len(line)
+        if good_bytes < os.path.getsize(self.path):
+            print(f"Dropping incomplete tail of {self.path}")
+            with open(self.path, 'r+b') as file:
+                file.truncate(good_bytes)
+        print(f"Resuming: {len(self.completed)} statements already done")
+
+    def __contains__(self, statement_name):
+        return statement_name in self.completed
+
+    def __len__(self):
+        return len(self.completed)
+
+    def record(self, statement_name, rows, layout_warnings=()):
+        """Durably mark a statement as finished along with its rows"""
+        entry = {'file': statement_name, 'rows': rows, 'finished': datetime.now().isoformat(timespec='seconds')}
+        if layout_warnings:
+            entry['layout_warnings'] = list(layout_warnings)
+            self.layout_warnings[statement_name] = entry['layout_warnings']
+        self._file.write(json.dumps(entry, default=str) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.completed[statement_name] = rows
+
+    def rows(self):
+        """Rows of every finished statement, in completion order"""
+        return [row for rows in self.completed.values() for row in rows]
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
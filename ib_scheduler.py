@@ -0,0 +1,181 @@
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from ib_statement_reader import is_archive, iter_archive_members
+from ib_extractor_clean import IBStatementExtractor, extract_rows_from_bytes, read_statement_bytes
+
+
+def extract_tenant_file(file_path, data=None):
+    """Worker entry point: read the file here unless it came out of an archive
+
+    Returns the rows and the layout warnings raised while parsing them.
+    """
+    if data is None:
+        data = read_statement_bytes(file_path)
+    return extract_rows_from_bytes(file_path, data)
+
+
+class Tenant:
+    """One client's input root, its pending work and its results"""
+
+    def __init__(self, name, root, start_period=None, end_period=None, recursive=False):
+        self.name = name
+        self.root = root
+        self.extractor = IBStatementExtractor()
+        self.pending = self._sources(start_period, end_period, recursive)
+        self.next_item = next(self.pending, None)
+        self.in_flight = 0
+        self.dispatched = 0
+        self.errors = 0
+        self.started = None
+        self.finished = None
+
+    def _sources(self, start_period, end_period, recursive):
+        # Archive members carry their bytes; folder files are read by the worker
+        if is_archive(self.root):
+            yield from iter_archive_members(self.root, start_period, end_period)
+        else:
+            for file_path in self.extractor.find_statement_files(self.root, recursive, start_period, end_period):
+                yield file_path, None
+
+    def has_pending(self):
+        return self.next_item is not None
+
+    def take(self):
+        item = self.next_item
+        self.next_item = next(self.pending, None)
+        self.in_flight += 1
+        self.dispatched += 1
+        if self.started is None:
+            self.started = time.time()
+        return item
+
+    def done(self):
+        return not self.has_pending() and self.in_flight == 0
+
+
+class TenantScheduler:
+    """Run many clients' statement folders through one shared worker pool
+
+    Each tenant keeps its own queue. Whenever a worker frees up, the
+    tenant with the fewest statements in flight (then the fewest
+    dispatched) goes next, so a client with decades of history cannot
+    starve the others, while an idle pool is always kept busy.
+    max_per_tenant optionally caps any one tenant's share of the workers.
+    Each tenant's workbook is written as soon as its last statement is done.
+    """
+
+    def __init__(self, tenants, workers=None, max_per_tenant=None, output_dir=".",
+                 start_period=None, end_period=None, recursive=False):
+        if not isinstance(tenants, dict):
+            tenants = unique_tenants((os.path.basename(os.path.normpath(root)), root) for root in tenants)
+        self.workers = workers or os.cpu_count() or 1
+        self.max_per_tenant = max_per_tenant
+        self.output_dir = output_dir
+        self.tenants = [Tenant(name, root, start_period, end_period, recursive) for name, root in tenants.items()]
+
+    def output_path(self, tenant):
+        return os.path.join(self.output_dir, f"{tenant.name}_IB_PnL_Summary.xlsx")
+
+    def next_tenant(self):
+        eligible = [tenant for tenant in self.tenants if tenant.has_pending()
+                    and (not self.max_per_tenant or tenant.in_flight < self.max_per_tenant)]
+        if not eligible:
+            return None
+        return min(eligible, key=lambda tenant: (tenant.in_flight, tenant.dispatched))
+
+    def run(self, executor=None):
+        """Process every tenant; returns per-tenant statistics"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        pool = executor or ProcessPoolExecutor(max_workers=self.workers)
+        running = {}
+        try:
+            for tenant in self.tenants:
+                if tenant.done():
+                    print(f"No statements for tenant {tenant.name}")
+            while True:
+                while len(running) < self.workers:
+                    tenant = self.next_tenant()
+                    if tenant is None:
+                        break
+                    file_path, data = tenant.take()
+                    running[pool.submit(extract_tenant_file, file_path, data)] = (tenant, file_path)
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    tenant, file_path = running.pop(future)
+                    tenant.in_flight -= 1
+                    try:
+                        rows, layout_warnings = future.result()
+                        tenant.extractor.data.extend(rows)
+                        tenant.extractor.perf_summary.merge_layout_warnings(layout_warnings)
+                    except Exception as e:
+                        tenant.errors += 1
+                        print(f"Error processing {file_path} for {tenant.name}: {e}")
+                    if tenant.done():
+                        self.finish(tenant)
+        finally:
+            if executor is None:
+                pool.shutdown()
+        return self.stats()
+
+    def finish(self, tenant):
+        tenant.finished = time.time()
+        print(f"Tenant {tenant.name} finished {tenant.dispatched} statements")
+        tenant.extractor.save_to_excel(self.output_path(tenant))
+
+    def stats(self):
+        return [{
+            'Tenant': tenant.name,
+            'Statements': tenant.dispatched,
+            'Rows': len(tenant.extractor.data),
+            'Errors': tenant.errors,
+            'Seconds': round(tenant.finished - tenant.started, 2) if tenant.finished and tenant.started else 0,
+            'Output': self.output_path(tenant) if tenant.extractor.data else None,
+        } for tenant in self.tenants]
+
+
+def unique_tenants(pairs):
+    """{name: root} from (name, root) pairs, refusing two roots under one name"""
+    tenants = {}
+    for name, root in pairs:
+        if name in tenants:
+            raise ValueError(f"Tenant name {name!r} is used for both {tenants[name]} and {root}; "
+                             f"name them explicitly as name=path")
+        tenants[name] = root
+    return tenants
+
+
+def parse_tenant(spec):
+    """'name=path' or a bare path (named after its folder)"""
+    name, separator, root = spec.partition('=')
+    if not separator:
+        return os.path.basename(os.path.normpath(spec)), spec
+    return name, root
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract P&L for many clients through one shared worker pool")
+    parser.add_argument('tenants', nargs='+', help="statement roots as name=path (or just path)")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-per-tenant', type=int, default=None)
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--recursive', action='store_true')
+    args = parser.parse_args()
+
+    try:
+        tenants = unique_tenants(parse_tenant(spec) for spec in args.tenants)
+    except ValueError as e:
+        parser.error(str(e))
+    scheduler = TenantScheduler(tenants, args.workers, args.max_per_tenant, args.output_dir,
+                                recursive=args.recursive)
+    for stats in scheduler.run():
+        print(f"{stats['Tenant']}: {stats['Statements']} statements, {stats['Rows']} rows, "
+              f"{stats['Errors']} errors in {stats['Seconds']}s -> {stats['Output']}")
+
+
+if __name__ == "__main__":
+    main()
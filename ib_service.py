@@ -0,0 +1,218 @@
+import io
+import os
+import json
+import argparse
+import threading
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+WARM_UP_HTML = (b'<html><head><title> Activity Statement January 1, 2022 - January 31, 2022 </title></head>'
+                b'<body><div id="tblAccountSummaryBody"><table><tr><td>U***0000</td><td></td><td>Warm Up</td>'
+                b'<td>0</td><td>0</td><td>0%</td></tr></table></div></body></html>')
+
+
+def _warm_worker():
+    """Pay the pandas/bs4/PyPDF2 import and first-parse cost once per worker"""
+    _extract_quietly('warm-up.html', WARM_UP_HTML)
+
+
+def _extract_quietly(file_name, data):
+    from ib_extractor_clean import extract_rows_from_bytes
+    with contextlib.redirect_stdout(io.StringIO()):
+        return extract_rows_from_bytes(file_name, data)
+
+
+class StatementService:
+    """Long-running local HTTP front end for the extractor
+
+    POST /extract with the raw statement as the body (name it with the
+    X-Filename header or ?name=) returns {"file": ..., "rows": [...],
+    "layout_warnings": [...]}, the latter listing unrecognised table layouts.
+    Parsing runs in a pool of pre-warmed worker processes. At most
+    max_concurrent uploads are parsed at once, up to max_queue more wait
+    their turn, and anything beyond that is rejected with 503. If a worker
+    dies the pool is rebuilt and the upload retried once; should that fail
+    too, the upload gets 503 and the next one a fresh pool.
+    GET /health reports the pool state.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8765, workers=None, max_concurrent=None,
+                 max_queue=32, max_upload_mb=50):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_concurrent = max_concurrent or self.workers
+        self.max_queue = max_queue
+        self.max_upload_bytes = int(max_upload_mb * 1024 * 1024)
+        self.pool = self._new_pool()
+        self.pool_lock = threading.Lock()
+        self.pool_restarts = 0
+        self.slots = threading.BoundedSemaphore(self.max_concurrent)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker)
+
+    def _replace_pool(self, broken):
+        """Swap a broken pool for a fresh, warmed one (once, however many uploads saw it break)"""
+        with self.pool_lock:
+            if self.pool is not broken:
+                return
+            print("A worker process died; restarting the worker pool")
+            broken.shutdown(wait=False)
+            self.pool = self._new_pool()
+            self.pool_restarts += 1
+            self.warm_up()
+
+    def warm_up(self):
+        """Block until every worker process has started and parsed once"""
+        futures = [self.pool.submit(_extract_quietly, 'warm-up.html', WARM_UP_HTML)
+                   for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def start(self):
+        """Serve in a background thread (handy for local tests); returns the base URL"""
+        self.warm_up()
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.address
+
+    def serve_forever(self):
+        self.warm_up()
+        print(f"Serving statement extraction on {self.address} with {self.workers} workers")
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        if self._thread is not None:
+            self.server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server.server_close()
+        self.pool.shutdown()
+
+    def extract(self, file_name, data):
+        """Queue one upload for a worker: (rows, layout warnings), or None if the queue is full"""
+        with self.lock:
+            if self.in_flight >= self.max_concurrent + self.max_queue:
+                return None
+            self.in_flight += 1
+        try:
+            with self.slots:
+                for attempt in (1, 2):
+                    pool = self.pool
+                    try:
+                        return pool.submit(_extract_quietly, file_name, data).result()
+                    except BrokenProcessPool:
+                        self._replace_pool(pool)
+                        if attempt == 2:
+                            raise
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+                self.completed += 1
+
+    def health(self):
+        with self.lock:
+            return {
+                'status': 'ok',
+                'workers': self.workers,
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'in_flight': self.in_flight,
+                'completed': self.completed,
+                'pool_restarts': self.pool_restarts,
+            }
+
+    def _handler_class(self):
+        service = self
+
+        class StatementRequestHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, payload):
+                body = json.dumps(payload, default=str).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if urlparse(self.path).path == '/health':
+                    self._send_json(200, service.health())
+                else:
+                    self._send_json(404, {'error': 'not found'})
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                if url.path != '/extract':
+                    self._send_json(404, {'error': 'not found'})
+                    return
+
+                length = int(self.headers.get('Content-Length') or 0)
+                if length <= 0:
+                    self._send_json(400, {'error': 'empty upload'})
+                    return
+                if length > service.max_upload_bytes:
+                    self._send_json(413, {'error': 'upload too large'})
+                    return
+
+                file_name = parse_qs(url.query).get('name', [None])[0] or self.headers.get('X-Filename')
+                if not file_name or not file_name.lower().endswith(('.html', '.pdf')):
+                    self._send_json(400, {'error': 'name the upload with a .html or .pdf file name'})
+                    return
+
+                data = self.rfile.read(length)
+                try:
+                    result = service.extract(os.path.basename(file_name), data)
+                except BrokenProcessPool:
+                    self._send_json(503, {'error': 'worker process died, retry later'})
+                    return
+                except Exception as e:
+                    self._send_json(500, {'error': str(e)})
+                    return
+                if result is None:
+                    self._send_json(503, {'error': 'server busy, retry later'})
+                    return
+                rows, layout_warnings = result
+                self._send_json(200, {'file': os.path.basename(file_name), 'rows': rows,
+                                      'layout_warnings': layout_warnings})
+
+        return StatementRequestHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local IB statement extraction service")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-concurrent', type=int, default=None)
+    parser.add_argument('--max-queue', type=int, default=32)
+    parser.add_argument('--max-upload-mb', type=float, default=50)
+    args = parser.parse_args()
+
+    service = StatementService(args.host, args.port, args.workers, args.max_concurrent,
+                               args.max_queue, args.max_upload_mb)
+    service.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import os
+import sys
+import json
+import socket
+import hashlib
+import argparse
+import subprocess
+from datetime import datetime
+from ib_statement_reader import StatementBuffer, write_json_atomic
+from ib_run_journal import RunJournal
+from ib_extractor_clean import IBStatementExtractor
+
+SHARD_FORMAT = 1
+
+
+def shard_of(relative_path, shards):
+    """Shard number of a statement, from a hash of its path relative to the input root"""
+    digest = hashlib.sha1(relative_path.replace(os.sep, '/').encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % shards
+
+
+def _read_json(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def build_manifest(folder_path, shards, manifest_path="IB_Shards.json", recursive=False):
+    """Plan a sharded run: every statement of the folder, in period order, with its shard
+
+    The plan (including the HTML-over-PDF choice) is made once here, so all
+    nodes agree on the work however their copies of the archive are mounted.
+    """
+    if shards < 1:
+        raise ValueError("shards must be at least 1")
+    extractor = IBStatementExtractor()
+    files = []
+    for file_path in extractor.find_statement_files(folder_path, recursive):
+        relative_path = os.path.relpath(file_path, folder_path).replace(os.sep, '/')
+        stat = os.stat(file_path)
+        files.append({'path': relative_path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                      'shard': shard_of(relative_path, shards)})
+    # A re-issued statement changes its size or mtime, and with it the manifest id
+    manifest_id = hashlib.sha256(json.dumps([(entry['path'], entry['size'], entry['mtime_ns'])
+                                             for entry in files]).encode('utf-8'))
+    manifest = {
+        'format': SHARD_FORMAT,
+        'manifest_id': f"{manifest_id.hexdigest()[:16]}-{shards}",
+        'root': os.path.abspath(folder_path),
+        'shards': shards,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'files': files,
+    }
+    write_json_atomic(manifest_path, manifest, default=str)
+    counts = [sum(1 for entry in files if entry['shard'] == shard) for shard in range(shards)]
+    print(f"Planned {len(files)} statements over {shards} shards {counts} -> {manifest_path}")
+    return manifest
+
+
+def partial_path(output_dir, shard, shards):
+    return os.path.join(output_dir, f"IB_PnL_shard-{shard:03d}-of-{shards:03d}.json")
+
+
+def journal_path(output_path, manifest_id):
+    return f"{output_path}.{manifest_id}.journal"
+
+
+def _discard_stale_journals(output_path, manifest_id):
+    """Remove this shard's journals left by runs of other manifests"""
+    keep = os.path.basename(journal_path(output_path, manifest_id))
+    prefix = os.path.basename(output_path) + '.'
+    directory = os.path.dirname(output_path) or '.'
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name.endswith('.journal') and name != keep:
+            print(f"Discarding {name}: it belongs to another manifest")
+            os.remove(os.path.join(directory, name))
+
+
+def run_shard(manifest_path, shard, output_dir=".", root=None):
+    """Extract one shard's statements and write its partial result
+
+    The partial names the manifest, shard and node it came from, and lists
+    every statement it covers, so merge can check nothing is missing or
+    counted twice. A per-shard journal, named after the manifest id, lets a
+    killed node resume; journals of other manifests are never reused.
+    """
+    manifest = _read_json(manifest_path)
+    shards = manifest['shards']
+    if not 0 <= shard < shards:
+        raise ValueError(f"shard must be between 0 and {shards - 1}")
+    root = root or manifest['root']
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = partial_path(output_dir, shard, shards)
+
+    extractor = IBStatementExtractor()
+    started = datetime.now().isoformat(timespec='seconds')
+    entries = [entry for entry in manifest['files'] if entry['shard'] == shard]
+    errors = []
+    _discard_stale_journals(output_path, manifest['manifest_id'])
+    with RunJournal(journal_path(output_path, manifest['manifest_id']), resume=True) as journal:
+        for entry in entries:
+            if entry['path'] in journal:
+                # Finished before a restart; its layout warnings come from the journal
+                extractor.perf_summary.merge_layout_warnings(journal.layout_warnings.get(entry['path'], []))
+                continue
+            file_path = os.path.join(root, entry['path'])
+            print(f"Processing: {file_path}")
+            counts = extractor.perf_summary.warning_counts()
+            try:
+                with StatementBuffer.open(file_path) as statement:
+                    rows = extractor.extract_statement_rows(statement)
+            except OSError as e:
+                print(f"Error reading {file_path}: {e}")
+                errors.append({'path': entry['path'], 'error': str(e)})
+                continue
+            journal.record(entry['path'], rows, extractor.perf_summary.layout_warnings_since(counts))
+        completed = dict(journal.completed)
+
+    partial = {
+        'format': SHARD_FORMAT,
+        'manifest_id': manifest['manifest_id'],
+        'shard': shard,
+        'shards': shards,
+        'node': socket.gethostname(),
+        'started': started,
+        'finished': datetime.now().isoformat(timespec='seconds'),
+        'files': [{'path': entry['path'], 'rows': len(completed[entry['path']])}
+                  for entry in entries if entry['path'] in completed],
+        'errors': errors,
+        'layout_warnings': extractor.perf_summary.layout_warnings(),
+        'rows': {entry['path']: completed[entry['path']] for entry in entries if entry['path'] in completed},
+    }
+    write_json_atomic(output_path, partial, default=str)
+    os.remove(journal_path(output_path, manifest['manifest_id']))
+    print(f"Shard {shard}/{shards}: {len(partial['files'])} statements, {len(errors)} errors -> {output_path}")
+    return output_path
+
+
+def merge_shards(manifest_path, partials_dir=".", output_path="IB_PnL_Summary.xlsx", allow_missing=False):
+    """Combine the shard partials into the usual Raw_Data / Summary_by_Year / Monthly_Summary workbook
+
+    Rows are put back in manifest order, so the workbook matches a
+    single-process run over the same folder.
+    """
+    manifest = _read_json(manifest_path)
+    shards = manifest['shards']
+    extractor = IBStatementExtractor()
+    rows_by_path = {}
+    missing = []
+    for shard in range(shards):
+        path = partial_path(partials_dir, shard, shards)
+        if not os.path.exists(path):
+            missing.append(shard)
+            continue
+        partial = _read_json(path)
+        if partial.get('format') != SHARD_FORMAT or partial['manifest_id'] != manifest['manifest_id']:
+            raise ValueError(f"{path} belongs to a different run ({partial.get('manifest_id')})")
+        for error in partial['errors']:
+            print(f"Shard {shard} could not read {error['path']}: {error['error']}")
+        rows_by_path.update(partial['rows'])
+        extractor.perf_summary.merge_layout_warnings(partial.get('layout_warnings', []))
+
+    if missing:
+        message = f"Missing partials for shards {missing}"
+        if not allow_missing:
+            raise ValueError(message)
+        print(f"Warning: {message}; merging the rest")
+
+    unaccounted = [entry['path'] for entry in manifest['files']
+                   if entry['path'] not in rows_by_path and entry['shard'] not in missing]
+    if unaccounted:
+        print(f"Warning: {len(unaccounted)} statements produced no partial output")
+
+    extractor.data = [row for entry in manifest['files'] for row in rows_by_path.get(entry['path'], [])]
+    extractor.save_to_excel(output_path)
+    return extractor.data
+
+
+def run_local(folder_path, shards, work_dir="IB_Shards", output_path="IB_PnL_Summary.xlsx", recursive=False):
+    """Plan, run every shard as its own process side by side, then merge"""
+    os.makedirs(work_dir, exist_ok=True)
+    manifest_path = os.path.join(work_dir, "manifest.json")
+    build_manifest(folder_path, shards, manifest_path, recursive)
+
+    script = os.path.abspath(__file__)
+    processes = []
+    for shard in range(shards):
+        log = open(os.path.join(work_dir, f"shard-{shard:03d}.log"), 'w', encoding='utf-8')
+        command = [sys.executable, script, 'run', manifest_path, '--shard', str(shard), '--output-dir', work_dir]
+        processes.append((shard, subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT), log))
+
+    failed = []
+    for shard, process, log in processes:
+        if process.wait() != 0:
+            failed.append(shard)
+        log.close()
+    if failed:
+        print(f"Shards {failed} failed; see their logs in {work_dir}")
+    return merge_shards(manifest_path, work_dir, output_path, allow_missing=bool(failed))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Split statement processing into shards and merge the results")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    plan = commands.add_parser('plan', help="write the shard manifest for a folder")
+    plan.add_argument('folder')
+    plan.add_argument('--shards', type=int, required=True)
+    plan.add_argument('--manifest', default='IB_Shards.json')
+    plan.add_argument('--recursive', action='store_true')
+
+    run = commands.add_parser('run', help="process one shard of a manifest")
+    run.add_argument('manifest')
+    run.add_argument('--shard', type=int, required=True)
+    run.add_argument('--output-dir', default='.')
+    run.add_argument('--root', default=None, help="where this node sees the statements folder")
+
+    merge = commands.add_parser('merge', help="combine shard partials into the summary workbook")
+    merge.add_argument('manifest')
+    merge.add_argument('--partials-dir', default='.')
+    merge.add_argument('--output', default='IB_PnL_Summary.xlsx')
+    merge.add_argument('--allow-missing', action='store_true')
+
+    local = commands.add_parser('local', help="plan, run all shards as local processes, and merge")
+    local.add_argument('folder')
+    local.add_argument('--shards', type=int, default=os.cpu_count() or 1)
+    local.add_argument('--work-dir', default='IB_Shards')
+    local.add_argument('--output', default='IB_PnL_Summary.xlsx')
+    local.add_argument('--recursive', action='store_true')
+
+    args = parser.parse_args(argv)
+    if args.command == 'plan':
+        build_manifest(args.folder, args.shards, args.manifest, args.recursive)
+    elif args.command == 'run':
+        run_shard(args.manifest, args.shard, args.output_dir, args.root)
+    elif args.command == 'merge':
+        merge_shards(args.manifest, args.partials_dir, args.output, args.allow_missing)
+    else:
+        run_local(args.folder, args.shards, args.work_dir, args.output, args.recursive)
+
+
+if __name__ == "__main__":
+    main()
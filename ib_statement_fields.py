@@ -0,0 +1,42 @@
+import re
+from datetime import datetime
+from ib_fragment_cache import section_rows
+
+CURRENCY_PATTERN = re.compile(r'^[A-Z]{3}$')
+# 'November 1, 2021 - November 30, 2021', in statement titles and the Period column
+PERIOD_PATTERN = re.compile(r'(\w+ \d+, \d+) - (\w+ \d+, \d+)')
+
+
+def parse_number(text, default=None):
+    """'-3,490.00' or '1.25%' -> float; default for blanks, dashes and other text"""
+    try:
+        return float(text.replace(',', '').replace('%', '').strip())
+    except ValueError:
+        return default
+
+
+def parse_statement_date(text):
+    """'November 30, 2021' -> date (None if unparseable)"""
+    try:
+        return datetime.strptime(text.strip(), '%B %d, %Y').date()
+    except (AttributeError, ValueError):
+        return None
+
+
+def period_bounds(period):
+    """(start, end) dates of a statement period, or of the period inside a title; (None, None) if absent"""
+    match = PERIOD_PATTERN.search(str(period or ''))
+    if not match:
+        return None, None
+    return parse_statement_date(match.group(1)), parse_statement_date(match.group(2))
+
+
+def base_currencies(statement):
+    """{account: base currency} from the Account Information sections"""
+    currencies = {}
+    for section_id in statement.sections():
+        if section_id.startswith('tblAccountInformation_'):
+            for _, cells in section_rows(statement, section_id):
+                if len(cells) >= 2 and cells[0] == 'Base Currency':
+                    currencies[section_id[len('tblAccountInformation_'):-len('Body')]] = cells[1]
+    return currencies
@@ -0,0 +1,151 @@
+import os
+import re
+from bisect import bisect_left, bisect_right
+from ib_statement_reader import is_statement_name, period_from_filename, period_in_range
+
+YEAR_DIR_PATTERN = re.compile(r'^((?:19|20)\d{2})$')
+MONTH_DIR_PATTERN = re.compile(r'^(0?[1-9]|1[0-2])$')
+YEAR_MONTH_DIR_PATTERN = re.compile(r'^((?:19|20)\d{2})[-_.]?(0[1-9]|1[0-2])$')
+ACCOUNT_NAME_PATTERN = re.compile(r'(?<![A-Za-z0-9])(U\d{5,}[A-Z]?)(?![A-Za-z0-9])')
+# Cheapest source first when the same statement was delivered in several formats
+SOURCE_PREFERENCE = ('.html', '.htm', '.pdf')
+
+
+def _directory_period_range(name, parent_range):
+    """Inclusive (first, last) period a directory can hold, judging by its name"""
+    match = YEAR_MONTH_DIR_PATTERN.match(name)
+    if match:
+        period = (int(match.group(1)), int(match.group(2)))
+        return period, period
+
+    match = YEAR_DIR_PATTERN.match(name)
+    if match:
+        year = int(match.group(1))
+        return (year, 1), (year, 12)
+
+    # A bare month directory only means something inside a year directory
+    match = MONTH_DIR_PATTERN.match(name)
+    if match and parent_range and parent_range[0][0] == parent_range[1][0]:
+        period = (parent_range[0][0], int(match.group(1)))
+        return period, period
+
+    return parent_range
+
+
+def _overlaps(period_range, start_period, end_period):
+    if period_range is None:
+        return True
+    first, last = period_range
+    if start_period and last < tuple(start_period):
+        return False
+    if end_period and first > tuple(end_period):
+        return False
+    return True
+
+
+class StatementIndex:
+    """Sorted period index of the statements under a directory tree
+
+    Periods come from names like ActivityStatement.YYYYMM.html. Directories
+    named YYYY, YYYY/MM or YYYYMM that cannot hold the requested range are
+    never descended into, and files are selected without being opened.
+    """
+
+    def __init__(self, root, recursive=True, start_period=None, end_period=None):
+        self.root = root
+        self.periods = []
+        self.paths = []
+        self.undated = []
+        self.scan(recursive, start_period, end_period)
+
+    def scan(self, recursive=True, start_period=None, end_period=None):
+        """(Re)build the index with os.scandir, pruning out-of-range directories"""
+        entries = []
+        undated = []
+        pending = [(self.root, None)]
+        while pending:
+            directory, directory_range = pending.pop()
+            try:
+                with os.scandir(directory) as scanner:
+                    for entry in scanner:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not recursive:
+                                continue
+                            child_range = _directory_period_range(entry.name, directory_range)
+                            if _overlaps(child_range, start_period, end_period):
+                                pending.append((entry.path, child_range))
+                        elif entry.is_file() and is_statement_name(entry.name):
+                            period = period_from_filename(entry.name)
+                            if period is None:
+                                undated.append(entry.path)
+                            elif period_in_range(period, start_period, end_period):
+                                entries.append((period, entry.path))
+            except OSError as e:
+                print(f"Error scanning {directory}: {e}")
+
+        entries.sort()
+        self.periods = [period for period, _ in entries]
+        self.paths = [path for _, path in entries]
+        self.undated = sorted(undated)
+        return self
+
+    def __len__(self):
+        return len(self.paths) + len(self.undated)
+
+    def files(self, start_period=None, end_period=None, include_undated=True):
+        """Paths within the inclusive (year, month) range, in period order"""
+        first = bisect_left(self.periods, tuple(start_period)) if start_period else 0
+        last = bisect_right(self.periods, tuple(end_period)) if end_period else len(self.periods)
+        files = self.paths[first:last]
+        if include_undated:
+            files = files + self.undated
+        return files
+
+    def periods_available(self):
+        """Distinct (year, month) periods in the index"""
+        return sorted(set(self.periods))
+
+
+def statement_key(path):
+    """Grouping key for copies of one statement delivered in several formats
+
+    Copies share a directory and either the same name up to the extension
+    (X.pdf / X.html) or the same account number and period in their names.
+    Names without a full account number are only grouped with their exact twins.
+    """
+    directory, name = os.path.split(path)
+    stem = os.path.splitext(name)[0].lower()
+    period = period_from_filename(name)
+    match = ACCOUNT_NAME_PATTERN.search(name)
+    if period is None or match is None:
+        return directory, stem
+    return directory, match.group(1), period
+
+
+def _source_rank(path):
+    extension = os.path.splitext(path)[1].lower()
+    return SOURCE_PREFERENCE.index(extension) if extension in SOURCE_PREFERENCE else len(SOURCE_PREFERENCE)
+
+
+def plan_sources(paths):
+    """Keep one source per statement, preferring HTML over PDF
+
+    Returns the chosen paths (input order preserved) and one decision per
+    statement whose other formats were dropped: {'Chosen': path, 'Skipped': [paths]}.
+    """
+    groups = {}
+    for path in paths:
+        groups.setdefault(statement_key(path), []).append(path)
+
+    chosen = set()
+    decisions = []
+    for sources in groups.values():
+        ranked = sorted(sources, key=_source_rank)
+        # Files in the chosen format are separate statements, never copies of each other
+        extension = os.path.splitext(ranked[0])[1].lower()
+        kept = [path for path in ranked if os.path.splitext(path)[1].lower() == extension]
+        skipped = [path for path in ranked if path not in kept]
+        chosen.update(kept)
+        if skipped:
+            decisions.append({'Chosen': ranked[0], 'Skipped': skipped})
+    return [path for path in paths if path in chosen], decisions
@@ -0,0 +1,209 @@
+import io
+import os
+import re
+import gzip
+import json
+import mmap
+import hashlib
+import tarfile
+import zipfile
+
+STATEMENT_EXTENSIONS = ('.pdf', '.html')
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+# ActivityStatement.YYYYMM.html, ActivityStatement.202507 6153.pdf, ...
+FILENAME_PERIOD_PATTERN = re.compile(r'(?<!\d)((?:19|20)\d{2})(0[1-9]|1[0-2])(?!\d)')
+TITLE_PATTERN = re.compile(rb'<title>(.*?)</title>', re.IGNORECASE | re.DOTALL)
+SECTION_ID_PATTERN = re.compile(rb'<div\b[^>]*?\bid="(tbl[^"]*?Body)"', re.IGNORECASE)
+DIV_TAG_PATTERN = re.compile(rb'<(/?)div\b', re.IGNORECASE)
+
+
+class StatementBuffer:
+    """Read-only byte view over one statement file (memory-mapped when possible)"""
+
+    def __init__(self, name, data, mapped_file=None):
+        self.name = name
+        self._data = data
+        self._mapped_file = mapped_file
+        self._sections = None
+
+    @classmethod
+    def open(cls, path):
+        """Memory-map a statement file once for all readers"""
+        file = open(path, 'rb')
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            data = b''
+        except BaseException:
+            file.close()
+            raise
+        return cls(path, data, mapped_file=file)
+
+    @classmethod
+    def from_bytes(cls, name, data):
+        """Wrap bytes that were already read (archives, uploads)"""
+        return cls(name, data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._data)
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        if self._mapped_file is not None:
+            self._mapped_file.close()
+            self._mapped_file = None
+        self._data = b''
+        self._sections = None
+
+    def decode(self, start=0, end=None):
+        """Decode only the requested byte range"""
+        with memoryview(self._data) as data, data[start:end] as part:
+            return str(part, 'utf-8', errors='replace')
+
+    def stream(self):
+        """Seekable binary stream over the buffer, for readers such as PyPDF2"""
+        if isinstance(self._data, mmap.mmap):
+            self._data.seek(0)
+            return self._data
+        return io.BytesIO(self._data)
+
+    def search(self, pattern, start=0):
+        """Run a compiled bytes pattern over the buffer without copying it"""
+        return pattern.search(self._data, start)
+
+    def sha256(self):
+        """Content hash of the statement"""
+        return hashlib.sha256(self._data).hexdigest()
+
+    def title(self):
+        """Decoded <title> text, or None if the document has none"""
+        match = self.search(TITLE_PATTERN)
+        if not match:
+            return None
+        return self.decode(match.start(1), match.end(1))
+
+    def _section_end(self, start):
+        depth = 0
+        for tag in DIV_TAG_PATTERN.finditer(self._data, start):
+            if tag.group(1):
+                depth -= 1
+                if depth == 0:
+                    return self._data.find(b'>', tag.end()) + 1
+            else:
+                depth += 1
+        return len(self._data)
+
+    def sections(self):
+        """Byte ranges of every tbl*Body section, located in a single scan"""
+        if self._sections is None:
+            self._sections = {}
+            position = 0
+            while True:
+                match = SECTION_ID_PATTERN.search(self._data, position)
+                if not match:
+                    break
+                section_id = match.group(1).decode('utf-8', errors='replace')
+                end = self._section_end(match.start())
+                self._sections.setdefault(section_id, (match.start(), end))
+                position = match.end()
+        return self._sections
+
+    def section_range(self, section_id):
+        """(start, end) byte range of one section, or None"""
+        return self.sections().get(section_id)
+
+    def section_html(self, section_id):
+        """Decoded HTML of one section, or None"""
+        bounds = self.section_range(section_id)
+        if bounds is None:
+            return None
+        return self.decode(*bounds)
+
+
+def read_statement_file(path, read, default=None):
+    """read(statement) over one memory-mapped statement file; default if the file cannot be read"""
+    try:
+        with StatementBuffer.open(path) as statement:
+            return read(statement)
+    except OSError as e:
+        print(f"Error reading {path}: {e}")
+        return default
+
+
+def html_paths(file_paths):
+    """The HTML statements among file_paths (the section readers need HTML)"""
+    return [path for path in file_paths if path.lower().endswith('.html')]
+
+
+def write_json_atomic(path, payload, compress=False, **dump_options):
+    """Write JSON to a temporary file and rename it into place, so readers never see half a file"""
+    temp_path = path + '.tmp'
+    opener = gzip.open if compress else open
+    with opener(temp_path, 'wt', encoding='utf-8') as file:
+        json.dump(payload, file, **dump_options)
+    os.replace(temp_path, path)
+
+
+def is_statement_name(name):
+    return name.lower().endswith(STATEMENT_EXTENSIONS)
+
+
+def is_archive(path):
+    return os.path.isfile(path) and path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def period_from_filename(name):
+    """(year, month) encoded in a statement file name, or None"""
+    match = FILENAME_PERIOD_PATTERN.search(os.path.basename(name))
+    if not match:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
+def period_in_range(period, start_period=None, end_period=None):
+    """Whether a (year, month) falls within the inclusive range; unknown periods are kept"""
+    if period is None:
+        return True
+    if start_period and period < tuple(start_period):
+        return False
+    if end_period and period > tuple(end_period):
+        return False
+    return True
+
+
+def iter_archive_members(archive_path, start_period=None, end_period=None):
+    """Yield (name, bytes) for each statement in a .zip/.tar(.gz) archive
+
+    Members are selected by file name and filename period before any of
+    their content is read. Zip members outside the range are never
+    decompressed. A compressed tar is streamed in a single pass, and only
+    the selected members are extracted.
+    """
+    def wanted(member_name):
+        return (is_statement_name(member_name) and
+                period_in_range(period_from_filename(member_name), start_period, end_period))
+
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            members = sorted((info for info in archive.infolist()
+                              if not info.is_dir() and wanted(info.filename)),
+                             key=lambda info: info.filename)
+            for info in members:
+                yield os.path.join(archive_path, info.filename), archive.read(info)
+        return
+
+    with tarfile.open(archive_path, mode='r|*') as archive:
+        for member in archive:
+            if not member.isfile() or not wanted(member.name):
+                continue
+            file = archive.extractfile(member)
+            if file is not None:
+                yield os.path.join(archive_path, member.name), file.read()
@@ -0,0 +1,150 @@
+import os
+import sqlite3
+import pandas as pd
+from ib_statement_reader import StatementBuffer
+from ib_statement_fields import period_bounds
+
+PNL_COLUMNS = [
+    ('Stocks_Realized', 'stocks_realized'),
+    ('Options_Realized', 'options_realized'),
+    ('Forex_Realized', 'forex_realized'),
+    ('Total_Realized', 'total_realized'),
+]
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS pnl_rows (
+        file_hash TEXT NOT NULL,
+        account TEXT NOT NULL,
+        period_start TEXT NOT NULL,
+        period_end TEXT NOT NULL,
+        file TEXT NOT NULL,
+        name TEXT,
+        year INTEGER,
+        month INTEGER,
+        stocks_realized REAL NOT NULL DEFAULT 0,
+        options_realized REAL NOT NULL DEFAULT 0,
+        forex_realized REAL NOT NULL DEFAULT 0,
+        total_realized REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (file_hash, account, period_start, period_end)
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_pnl_rows_account_period ON pnl_rows (account, period_end)",
+    "CREATE INDEX IF NOT EXISTS idx_pnl_rows_period ON pnl_rows (period_end)",
+    "CREATE INDEX IF NOT EXISTS idx_pnl_rows_file ON pnl_rows (file)",
+]
+
+
+def _period_bounds(period):
+    """ISO start and end dates of a Period value ('' where unparseable)"""
+    return tuple(date.isoformat() if date else '' for date in period_bounds(period))
+
+
+def _int_or_none(value):
+    return value if isinstance(value, int) else None
+
+
+class StatementWarehouse:
+    """Local SQLite store of extracted P&L rows, keyed on (file hash, account, period)"""
+
+    def __init__(self, db_path="IB_PnL_Warehouse.sqlite", batch_size=1000):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            for statement in SCHEMA:
+                self.conn.execute(statement)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def upsert_rows(self, rows, file_hashes):
+        """Bulk upsert extractor rows; file_hashes maps row['File'] to its content hash"""
+        records = []
+        for row in rows:
+            period_start, period_end = _period_bounds(row.get('Period'))
+            records.append((
+                file_hashes[row['File']],
+                row['Account'],
+                period_start,
+                period_end,
+                row['File'],
+                row.get('Name'),
+                _int_or_none(row.get('Year')),
+                _int_or_none(row.get('Month')),
+            ) + tuple(float(row.get(column) or 0) for column, _ in PNL_COLUMNS))
+
+        value_columns = ', '.join(name for _, name in PNL_COLUMNS)
+        updates = ', '.join(f"{name} = excluded.{name}" for _, name in PNL_COLUMNS)
+        sql = (
+            "INSERT INTO pnl_rows (file_hash, account, period_start, period_end, file, name, year, month, "
+            f"{value_columns}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (file_hash, account, period_start, period_end) DO UPDATE SET "
+            f"file = excluded.file, name = excluded.name, year = excluded.year, month = excluded.month, {updates}"
+        )
+
+        # A re-issued statement replaces the rows of its previous version
+        replaced = list(file_hashes.items())
+        for start in range(0, max(len(records), 1), self.batch_size):
+            with self.conn:
+                if start == 0:
+                    self.conn.executemany("DELETE FROM pnl_rows WHERE file = ? AND file_hash != ?", replaced)
+                self.conn.executemany(sql, records[start:start + self.batch_size])
+
+        print(f"Upserted {len(records)} rows into {self.db_path}")
+        return len(records)
+
+    def ingest_files(self, extractor, file_paths):
+        """Run the extractor over file_paths and upsert the rows they produce"""
+        first_row = len(extractor.data)
+        file_hashes = {}
+        for file_path in file_paths:
+            extractor.process_statement(file_path)
+            try:
+                with StatementBuffer.open(file_path) as statement:
+                    file_hashes[os.path.basename(file_path)] = statement.sha256()
+            except OSError as e:
+                print(f"Error hashing {file_path}: {e}")
+
+        rows = [row for row in extractor.data[first_row:] if row['File'] in file_hashes]
+        return self.upsert_rows(rows, file_hashes)
+
+    def pnl_by_account(self, start_date=None, end_date=None, accounts=None):
+        """Realized P&L per account for statements ending within [start_date, end_date]"""
+        sums = ', '.join(f"SUM({name}) AS {column}" for column, name in PNL_COLUMNS)
+        sql = f"SELECT account AS Account, COUNT(*) AS Statements, {sums} FROM pnl_rows"
+        where, params = self._period_filter(start_date, end_date, accounts)
+        sql += where + " GROUP BY account ORDER BY account"
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    def pnl_rows(self, start_date=None, end_date=None, accounts=None):
+        """Stored rows for statements ending within [start_date, end_date]"""
+        values = ', '.join(f"{name} AS {column}" for column, name in PNL_COLUMNS)
+        sql = (
+            "SELECT file AS File, year AS Year, month AS Month, period_start AS Period_Start, "
+            f"period_end AS Period_End, account AS Account, name AS Name, {values} FROM pnl_rows"
+        )
+        where, params = self._period_filter(start_date, end_date, accounts)
+        sql += where + " ORDER BY period_end, account"
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    def _period_filter(self, start_date, end_date, accounts):
+        clauses = []
+        params = []
+        if start_date:
+            clauses.append("period_end >= ?")
+            params.append(str(start_date))
+        if end_date:
+            clauses.append("period_end <= ?")
+            params.append(str(end_date))
+        if accounts:
+            clauses.append(f"account IN ({', '.join('?' for _ in accounts)})")
+            params.extend(accounts)
+        if not clauses:
+            return "", params
+        return " WHERE " + " AND ".join(clauses), params
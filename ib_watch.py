@@ -0,0 +1,240 @@
+import os
+import time
+import json
+import argparse
+from datetime import datetime
+from ib_statement_reader import StatementBuffer, is_statement_name, read_statement_file, write_json_atomic
+from ib_statement_index import statement_key, plan_sources
+from ib_aggregate_store import AggregateStore
+from ib_partitions import PARTITION_SCHEMES
+from ib_extractor_clean import IBStatementExtractor, write_workbook
+
+# Names browsers, copy tools and editors use while a file is still being written
+PARTIAL_SUFFIXES = ('.part', '.partial', '.crdownload', '.download', '.tmp')
+
+
+class InboxWatcher:
+    """Keep the outputs current while statements land in a drop folder
+
+    The inbox is polled with a stat-only listing. A file is picked up once
+    its size and mtime have stayed the same for settle_seconds, so half
+    copied downloads are left alone. Only new or changed statements are
+    extracted: touched files whose content hash is unchanged are skipped,
+    and an HTML copy arriving after its PDF twin replaces it. Each batch is
+    folded into the partitioned workbooks (only changed partitions are
+    rewritten) and the aggregate store behind the summary workbook, and
+    deleted statements are taken back out of both. Statements are known by
+    their path relative to the inbox, also in the rows' File column, so
+    same-named files in different subfolders stay apart.
+    """
+
+    def __init__(self, inbox, output_dir="IB_PnL_Partitions", by='year', poll_interval=2.0,
+                 settle_seconds=2.0, recursive=False):
+        self.inbox = inbox
+        self.output_dir = output_dir
+        self.by = by
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.recursive = recursive
+        self.extractor = IBStatementExtractor()
+        self.aggregates = AggregateStore(os.path.join(output_dir, "IB_PnL_Aggregates.json"))
+        self.state_path = os.path.join(output_dir, "_watch_state.json")
+        self.summary_path = os.path.join(output_dir, "IB_PnL_Summary.xlsx")
+        # relative path -> {'size', 'mtime_ns', 'sha256', 'skipped'} for every statement already handled
+        self.processed = {}
+        # relative path -> ((size, mtime_ns), first time that signature was seen)
+        self.pending = {}
+        os.makedirs(output_dir, exist_ok=True)
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as file:
+                self.processed = json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"Error reading watch state {self.state_path}: {e}")
+            self.processed = {}
+        print(f"Watching with {len(self.processed)} statements already processed")
+
+    def save(self):
+        write_json_atomic(self.state_path, self.processed)
+
+    def source(self, path):
+        """File system path of a statement known by its inbox-relative path"""
+        return os.path.join(self.inbox, *path.split('/'))
+
+    def scan(self):
+        """{relative path: (size, mtime_ns)} of the statement files currently in the inbox"""
+        found = {}
+        directories = [self.inbox]
+        while directories:
+            try:
+                entries = list(os.scandir(directories.pop()))
+            except OSError as e:
+                print(f"Error listing inbox: {e}")
+                continue
+            for entry in entries:
+                name = entry.name.lower()
+                if entry.is_dir():
+                    if self.recursive and not name.startswith('.'):
+                        directories.append(entry.path)
+                    continue
+                if name.startswith(('.', '~$')) or name.endswith(PARTIAL_SUFFIXES):
+                    continue
+                if not is_statement_name(name):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                relative_path = os.path.relpath(entry.path, self.inbox).replace(os.sep, '/')
+                found[relative_path] = (stat.st_size, stat.st_mtime_ns)
+        return found
+
+    def settled(self, found, now):
+        """Paths that are new or changed and have stopped growing"""
+        ready = []
+        for path, signature in found.items():
+            known = self.processed.get(path)
+            if known and (known['size'], known['mtime_ns']) == signature:
+                self.pending.pop(path, None)
+                continue
+            seen = self.pending.get(path)
+            if seen is None or seen[0] != signature:
+                self.pending[path] = (signature, now)
+                continue
+            # Unchanged since the previous poll, and untouched for settle_seconds
+            if now - seen[1] >= self.settle_seconds or now - signature[1] / 1e9 >= self.settle_seconds:
+                ready.append(path)
+        for path in [path for path in self.pending if path not in found]:
+            del self.pending[path]
+        return ready
+
+    def poll(self, now=None):
+        """One pass over the inbox; returns the number of statements (re)processed or removed"""
+        found = self.scan()
+        ready = self.settled(found, now if now is not None else time.time())
+        deleted = [path for path in self.processed if path not in found]
+        if not ready and not deleted:
+            return 0
+        return self.apply(ready, deleted)
+
+    def apply(self, ready, deleted):
+        removed_files = set()
+        for path in deleted:
+            entry = self.processed.pop(path)
+            if not entry.get('skipped'):
+                removed_files.add(path)
+                # A twin skipped in favour of the deleted copy gets picked up again
+                for other in [other for other, known in self.processed.items()
+                              if known.get('skipped') and statement_key(other) == statement_key(path)]:
+                    del self.processed[other]
+            print(f"Removed: {path}")
+
+        changed = {}
+        for path in ready:
+            self.pending.pop(path, None)
+            try:
+                stat = os.stat(self.source(path))
+            except OSError as e:
+                print(f"Error reading {path}: {e}")
+                continue
+            digest = read_statement_file(self.source(path), StatementBuffer.sha256)
+            if digest is None:
+                continue
+            entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest, 'skipped': False}
+            known = self.processed.get(path)
+            if known and known['sha256'] == digest:
+                # Touched or re-copied with identical content
+                entry['skipped'] = known.get('skipped', False)
+                self.processed[path] = entry
+                continue
+            changed[path] = entry
+
+        # HTML beats PDF for the same statement, whichever arrived first
+        candidates = [path for path in self.processed if not self.processed[path].get('skipped')] + list(changed)
+        chosen, decisions = plan_sources(candidates)
+        chosen = set(chosen)
+        for decision in decisions:
+            for skipped in decision['Skipped']:
+                if skipped in self.processed and not self.processed[skipped].get('skipped'):
+                    removed_files.add(skipped)
+                    self.processed[skipped]['skipped'] = True
+                print(f"Skipping {skipped}: same statement as {decision['Chosen']}")
+
+        rows = []
+        for path, entry in changed.items():
+            self.processed[path] = entry
+            if path not in chosen:
+                entry['skipped'] = True
+                continue
+            print(f"Processing: {path}")
+            try:
+                with StatementBuffer.open(self.source(path)) as statement:
+                    file_rows = self.extractor.extract_statement_rows(statement)
+            except Exception as e:
+                print(f"Error processing {path}: {e}")
+                file_rows = []
+            for row in file_rows:
+                row['File'] = path
+            if not file_rows:
+                removed_files.add(path)
+            rows.extend(file_rows)
+
+        if rows or removed_files:
+            self.publish(rows, removed_files - {row['File'] for row in rows})
+        self.save()
+        return len(changed) + len(deleted)
+
+    def publish(self, rows, removed_files):
+        """Fold one batch into the partitioned workbooks and the summary workbook"""
+        self.extractor.data = rows
+        self.extractor.save_partitioned(self.output_dir, self.by, removed_files=sorted(removed_files))
+
+        self.aggregates.update_from_rows(rows)
+        for file_name in removed_files:
+            self.aggregates.remove_statement(file_name)
+        self.aggregates.save()
+        write_workbook(self.summary_path, {
+            'Summary_by_Year': self.aggregates.summary_by_year(),
+            'Monthly_Summary': self.aggregates.monthly_summary()
+        })
+        print(f"{datetime.now():%H:%M:%S} outputs updated: {len(rows)} rows in, "
+              f"{len(removed_files)} statements out")
+
+    def run(self, max_polls=None):
+        """Poll until interrupted (or for max_polls passes)"""
+        print(f"Watching {self.inbox} every {self.poll_interval}s; outputs in {self.output_dir}")
+        polls = 0
+        try:
+            while max_polls is None or polls < max_polls:
+                self.poll()
+                polls += 1
+                if max_polls is None or polls < max_polls:
+                    time.sleep(self.poll_interval)
+        except KeyboardInterrupt:
+            print("Stopped watching")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process IB statements as they arrive in a drop folder")
+    parser.add_argument('inbox', help="folder the statements are delivered to")
+    parser.add_argument('--output-dir', default='IB_PnL_Partitions')
+    parser.add_argument('--partition', choices=PARTITION_SCHEMES, default='year')
+    parser.add_argument('--poll-interval', type=float, default=2.0, help="seconds between inbox listings")
+    parser.add_argument('--settle', type=float, default=2.0,
+                        help="seconds a file must stay unchanged before it is read")
+    parser.add_argument('--recursive', action='store_true', help="watch subfolders as well")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.inbox):
+        print("Folder not found. Please check the path.")
+        return
+    InboxWatcher(args.inbox, args.output_dir, args.partition, args.poll_interval, args.settle,
+                 args.recursive).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import glob
+import numpy as np
+import pytest
+from ib_lot_matching import LotMatchingEngine
+
+
+@pytest.fixture(scope='module')
+def sample_trades():
+    engine = LotMatchingEngine()
+    engine.add_files(sorted(glob.glob('ActivityStatement.*.html')))
+    return engine.trade_rows
+
+
+def _engine(trade_rows, long_term_days=365):
+    engine = LotMatchingEngine(long_term_days)
+    engine.trade_rows = list(trade_rows)
+    return engine
+
+
+def _trade(date_time, quantity, proceeds, basis, code):
+    return {'File': 'synthetic.html', 'Account': 'U1', 'Asset_Class': 'Stocks', 'Currency': 'USD',
+            'Symbol': 'XYZ', 'Date_Time': np.datetime64(date_time, 's'), 'Quantity': quantity,
+            'Proceeds': proceeds, 'Commission': 0.0, 'Basis': basis, 'IB_Realized': 0.0, 'Code': code}
+
+
+def test_fifo_matches_ib_realized_where_the_history_is_complete(sample_trades):
+    reconciled = _engine(sample_trades).reconcile()
+    # Only the November 2021 statement of U1046153F closes lots opened before the loaded history
+    assert reconciled.loc[~reconciled['Reconciled'], ['File', 'Account']].values.tolist() == [
+        ['ActivityStatement.202111.html', 'U1046153F'],
+        ['ActivityStatement.202111.html', 'U1046153F'],
+    ]
+    complete = reconciled[reconciled['Unmatched_Quantity'] == 0]
+    assert (complete['Difference'] == 0).all()
+
+
+def test_lifo_picks_different_lots_but_realizes_the_same_once_flat(sample_trades):
+    engine = _engine(sample_trades)
+    fifo = engine.match('fifo').set_index('Trade_Id')
+    lifo = engine.match('lifo').set_index('Trade_Id')
+    changed = fifo.index[fifo['Realized_Total'] != lifo['Realized_Total']].tolist()
+    assert changed
+    # Both K200 09DEC21 410.0 C lots are closed by the end of the month
+    symbol = fifo[fifo['Symbol'] == 'K200 09DEC21 410.0 C'].index
+    assert set(symbol) <= set(changed)
+    assert lifo.loc[symbol, 'Realized_Total'].sum() == pytest.approx(fifo.loc[symbol, 'Realized_Total'].sum())
+
+
+def test_closes_of_lots_before_the_history_are_unmatched(sample_trades):
+    matched = _engine(sample_trades).match()
+    unmatched = matched[matched['Unmatched_Quantity'] > 0]
+    assert not unmatched.empty
+    assert (unmatched['Unmatched_Quantity'] == unmatched['Quantity'].abs()).all()
+    assert (unmatched['Realized_Total'] == 0).all()
+
+
+def test_a_trade_larger_than_the_position_flips_it():
+    engine = _engine([
+        _trade('2021-01-04T10:00:00', 10, -1000.0, 1000.0, 'O'),
+        _trade('2021-02-01T10:00:00', -15, 1800.0, -1800.0, 'C;O'),
+        _trade('2021-03-01T10:00:00', 5, -500.0, 500.0, 'C'),
+    ])
+    matched = engine.match()
+    # 10 sold at 120 against a 100 basis, then the 5 short at 120 bought back at 100
+    assert matched['Realized_Total'].tolist() == pytest.approx([200.0, 100.0])
+    assert matched['Unmatched_Quantity'].tolist() == [0.0, 0.0]
+
+
+def test_long_term_split_at_long_term_days(sample_trades):
+    # The ES 22NOV13 spreads were held for 21.7 days
+    es_trades = [trade for trade in sample_trades if trade['Symbol'].startswith('ES 22NOV13')]
+    short = _engine(es_trades, long_term_days=22).match()
+    long = _engine(es_trades, long_term_days=21).match()
+    assert (short['Realized_LT'] == 0).all()
+    assert (long['Realized_ST'] == 0).all()
+    assert long['Realized_LT'].tolist() == pytest.approx(short['Realized_ST'].tolist())
+    assert long['Realized_Total'].sum() == pytest.approx(471.60)
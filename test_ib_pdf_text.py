@@ -0,0 +1,56 @@
+import time
+from ib_pdf_text import scan_statement_text
+from ib_extractor_clean import IBStatementExtractor
+
+# Summary cells one per line, as PDF text extraction often produces them
+ONE_CELL_PER_LINE = '\n'.join([
+    'Activity Summary',
+    'January 1, 2022 - January 31, 2022',
+    'Account', 'Alias', 'Name', 'Prior NAV', 'Current NAV', 'TWR',
+    'U***6153', 'Kah Ann Lim', '67,484.32', '54,930.89', '-18.60%',
+    'U***6153F', 'Kah Ann Lim', '12,000.00', '11,500.00', '-4.17%',
+])
+
+ACCOUNT_INFORMATION = '\n'.join([
+    'Account Information',
+    'Name',
+    'Kah Ann Lim',
+    'Account',
+    'U1046153',
+    'Account Type Individual',
+    'Account Information',
+    'Name Kah Ann Lim',
+    'Account U1046153F',
+])
+
+
+def test_summary_rows_with_one_cell_per_line():
+    scan = scan_statement_text(ONE_CELL_PER_LINE)
+    assert scan['summary_accounts'] == [
+        {'account_number': 'U***6153', 'name': 'Kah Ann Lim'},
+        {'account_number': 'U***6153F', 'name': 'Kah Ann Lim'},
+    ]
+    assert scan['period'] == {'Activity Summary': ('January 1, 2022', 'January 31, 2022')}
+
+
+def test_extractor_reads_accounts_and_period_from_one_cell_per_line_text():
+    extractor = IBStatementExtractor()
+    assert [account['account_number'] for account in extractor.extract_account_info(ONE_CELL_PER_LINE)] == \
+        ['U***6153', 'U***6153F']
+    assert extractor.parse_statement_period(ONE_CELL_PER_LINE) == (2022, 1, 'January 1, 2022', 'January 31, 2022')
+
+
+def test_account_information_values_may_sit_on_the_next_line():
+    scan = scan_statement_text(ACCOUNT_INFORMATION)
+    assert scan['summary_accounts'] == []
+    assert scan['info_accounts'] == [
+        {'account_number': 'U1046153', 'name': 'Kah Ann Lim'},
+        {'account_number': 'U1046153F', 'name': 'Kah Ann Lim'},
+    ]
+
+
+def test_long_whitespace_runs_scan_quickly():
+    text = ('U1234567 Name ' + ' ' * 3000 + '\n') * 5
+    started = time.perf_counter()
+    scan_statement_text(text)
+    assert time.perf_counter() - started < 1
@@ -0,0 +1,24 @@
+from ib_perf_summary import PerfSummaryMatcher, STANDARD_HEADER
+from ib_extractor_clean import IBStatementExtractor
+
+VALUES = '0.00 100.00 -20.00 0.00 0.00 80.00 0.00 0.00 0.00 0.00 0.00 80.00'
+
+
+def test_header_with_one_cell_per_line_falls_back_to_standard_offsets():
+    section = '\n'.join(STANDARD_HEADER) + f"\nTotal Stocks {VALUES}\nTotal (All Assets) {VALUES}\n"
+    extractor = IBStatementExtractor()
+    extractor.perf_summary.set_source('wrapped.pdf')
+    pnl = extractor.parse_pnl_section(section)
+    assert pnl['stocks']['realized'] == 80.0
+    assert pnl['total']['realized'] == 80.0
+    [warning] = extractor.perf_summary.layout_warnings()
+    assert warning['Header'] == 'Symbol'
+    assert 'standard layout assumed' in warning['Problem']
+    assert warning['First_Seen_In'] == 'wrapped.pdf'
+
+
+def test_standard_header_is_not_flagged():
+    matcher = PerfSummaryMatcher()
+    offsets = matcher.value_offsets(STANDARD_HEADER)
+    assert offsets['Realized'] == 7
+    assert matcher.layout_warnings() == []
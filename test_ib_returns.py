@@ -0,0 +1,67 @@
+import glob
+import math
+import numpy as np
+import pytest
+from ib_returns import ReturnsEngine
+
+
+def _day(text):
+    return np.datetime64(text, 'D')
+
+
+def _engine(periods, flows=()):
+    engine = ReturnsEngine()
+    for start, end, start_nav, end_nav in periods:
+        engine.nav_rows.append({'File': 'synthetic.html', 'Account': 'U1', 'Start_Date': _day(start),
+                                'End_Date': _day(end), 'Start_NAV': start_nav, 'End_NAV': end_nav,
+                                'IB_TWR': None})
+    for date, amount in flows:
+        engine.flow_rows.append({'File': 'synthetic.html', 'Account': 'U1', 'Date': _day(date),
+                                 'Kind': 'Deposit/Withdrawal', 'Currency': 'USD', 'Amount': amount,
+                                 'Base_Amount': amount, 'Description': f"Deposit {date}"})
+    return engine
+
+
+def test_modified_dietz_link_weights_a_flow_by_its_time_invested():
+    # 100 deposited half way through a 30-day period is weighted 0.5
+    engine = _engine([('2021-10-31', '2021-11-30', 1000.0, 1200.0)], [('2021-11-15', 100.0)])
+    expected = (1200.0 - 1000.0 - 100.0) / (1000.0 + 100.0 * 0.5)
+    assert engine.returns()['Return'].iloc[0] == pytest.approx(expected)
+    assert engine.money_weighted_return('U1') == pytest.approx(expected)
+    assert engine.time_weighted_return('U1') == pytest.approx(expected)
+
+
+def test_range_queries_chain_whole_periods():
+    engine = _engine([('2021-10-31', '2021-11-30', 1000.0, 1100.0),
+                      ('2021-11-30', '2021-12-31', 1100.0, 1045.0)])
+    assert engine.time_weighted_return('U1') == pytest.approx(1.10 * 0.95 - 1)
+    assert engine.money_weighted_return('U1') == pytest.approx(0.045)
+    assert engine.time_weighted_return('U1', '2021-12-01', '2021-12-31') == pytest.approx(-0.05)
+    assert engine.time_weighted_return('U1', end_date='2021-11-30') == pytest.approx(0.10)
+    assert math.isnan(engine.time_weighted_return('U1', '2022-01-01'))
+    assert math.isnan(engine.money_weighted_return('U2'))
+
+
+def test_ranges_across_missing_statements_are_nan():
+    engine = _engine([('2021-10-31', '2021-11-30', 1000.0, 1100.0),
+                      ('2022-01-31', '2022-02-28', 2000.0, 2200.0)])
+    assert math.isnan(engine.time_weighted_return('U1'))
+    assert math.isnan(engine.money_weighted_return('U1'))
+    assert engine.money_weighted_return('U1', '2022-02-01') == pytest.approx(0.10)
+
+    returns = engine.returns()
+    assert returns['After_Gap'].tolist() == [False, True]
+    # The cumulative return restarts after the gap instead of chaining across it
+    assert returns['Cumulative_Return'].tolist() == pytest.approx([0.10, 0.10])
+
+
+def test_sample_statements_do_not_chain_2013_into_2021():
+    engine = ReturnsEngine()
+    engine.add_files(sorted(glob.glob('ActivityStatement.*.html')))
+    for account in ('U1046153', 'U1046153F'):
+        assert math.isnan(engine.money_weighted_return(account))
+        assert math.isnan(engine.time_weighted_return(account))
+        assert not math.isnan(engine.money_weighted_return(account, '2021-11-01', '2021-12-31'))
+    links = engine.returns().dropna(subset=['IB_TWR'])
+    # Each link is close to the daily-valued TWR IB reports for the period
+    assert (links['Return'] - links['IB_TWR']).abs().max() < 0.002
@@ -0,0 +1,53 @@
+import os
+import json
+import signal
+import urllib.error
+import urllib.request
+import pytest
+from ib_service import StatementService
+
+SAMPLE = 'ActivityStatement.202112.html'
+
+
+@pytest.fixture
+def service():
+    service = StatementService(port=0, workers=1, max_concurrent=1, max_queue=0)
+    service.start()
+    yield service
+    service.shutdown()
+
+
+def _post(service, file_name):
+    with open(file_name, 'rb') as file:
+        request = urllib.request.Request(f"{service.address}/extract?name={file_name}", data=file.read())
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def test_extracts_a_posted_statement(service):
+    status, payload = _post(service, SAMPLE)
+    assert status == 200
+    assert payload['file'] == SAMPLE
+    assert {row['Account'] for row in payload['rows']} == {'U1046153', 'U1046153F'}
+
+
+def test_rejects_uploads_beyond_the_queue_with_503(service):
+    # Stand in for one upload already being parsed: no slot and no queue room left
+    with service.lock:
+        service.in_flight = service.max_concurrent + service.max_queue
+    status, payload = _post(service, SAMPLE)
+    assert status == 503
+    with service.lock:
+        service.in_flight = 0
+    assert _post(service, SAMPLE)[0] == 200
+
+
+def test_recovers_when_a_worker_process_dies(service):
+    for pid in list(service.pool._processes):
+        os.kill(pid, signal.SIGKILL)
+    assert _post(service, SAMPLE)[0] == 200
+    assert _post(service, SAMPLE)[0] == 200
+    assert service.health()['pool_restarts'] == 1
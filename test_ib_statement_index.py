@@ -0,0 +1,27 @@
+from ib_statement_index import plan_sources
+
+
+def test_different_accounts_same_month_are_all_kept():
+    paths = ['ActivityStatement.202507 6153.pdf', 'ActivityStatement.202507 7777.pdf']
+    chosen, decisions = plan_sources(paths)
+    assert chosen == paths
+    assert decisions == []
+
+
+def test_same_format_files_for_one_month_are_all_kept():
+    paths = ['ActivityStatement.202201.html', 'ActivityStatement.202201 U1234567.html']
+    chosen, _ = plan_sources(paths)
+    assert chosen == paths
+
+
+def test_pdf_twin_of_html_is_skipped():
+    paths = ['ActivityStatement.202201.pdf', 'ActivityStatement.202201.html']
+    chosen, decisions = plan_sources(paths)
+    assert chosen == ['ActivityStatement.202201.html']
+    assert decisions == [{'Chosen': 'ActivityStatement.202201.html', 'Skipped': ['ActivityStatement.202201.pdf']}]
+
+
+def test_same_account_and_period_in_other_format_is_skipped():
+    paths = ['U1234567_202201_activity.pdf', 'ActivityStatement_U1234567_202201.html']
+    chosen, _ = plan_sources(paths)
+    assert chosen == ['ActivityStatement_U1234567_202201.html']
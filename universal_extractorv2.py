@@ -3,10 +3,19 @@ import pandas as pd
 from datetime import datetime
 import os
 from bs4 import BeautifulSoup
+from ib_statement_reader import StatementBuffer
+from ib_perf_summary import PerfSummaryMatcher, pnl_row_values
+from ib_layouts import LAYOUT_WARNING_COLUMNS
+from ib_returns import TimeSeriesStore
+
+# pnl_data keys kept for callers of the original four-column extraction
+LEGACY_PNL_KEYS = {'stocks': 'Stocks', 'options': 'Options', 'forex': 'Forex', 'total': 'Total'}
 
 class IBStatementExtractor:
     def __init__(self):
         self.data = []
+        self.perf_summary = PerfSummaryMatcher()
+        self.series = TimeSeriesStore()
     
     def extract_text_from_html(self, html_path):
         """Extract text from HTML file"""
@@ -84,114 +93,80 @@ class IBStatementExtractor:
     
     def extract_pnl_from_html_2013(self, soup, account_num):
         """Extract P&L data from 2013 HTML format"""
-        pnl_data = {
-            'stocks': 0,
-            'options': 0,
-            'forex': 0,
-            'total': 0
-        }
-        
-        section_id = f"tblFIFOPerfSumByUnderlying{account_num}Body"
-        pnl_section = soup.find('div', {'id': section_id})
-        
-        if pnl_section:
-            print(f"Found 2013 P&L section for {account_num}")
-            table = pnl_section.find('table')
-            
-            if table:
-                rows = table.find_all('tr')
-                
-                for row in rows:
-                    cells = row.find_all('td')
-                    if not cells:
-                        continue
-                        
-                    first_cell_text = cells[0].get_text().strip()
-                    
-                    # Look for the "Total" row - realized P&L is in column 6
-                    if first_cell_text == 'Total' and len(cells) > 6:
-                        try:
-                            cell_value = cells[6].get_text().replace(',', '').strip()
-                            pnl_data['total'] = float(cell_value)
-                            print(f"  2013: Extracted realized P&L: {pnl_data['total']}")
-                            break
-                        except (ValueError, IndexError) as e:
-                            print(f"  Error parsing 2013 total: {e}")
-        else:
-            print(f"No 2013 P&L section found for {account_num}")
-        
-        return pnl_data
+        return self.match_pnl_section(soup, account_num, '2013')
     
     def extract_pnl_from_html_2021(self, soup, account_num):
         """Extract P&L data from 2021+ HTML format"""
+        return self.match_pnl_section(soup, account_num, '2021+')
+    
+    def match_pnl_section(self, soup, account_num, label):
+        """Run the performance summary table through the shared row-label matcher"""
         pnl_data = {
             'stocks': 0,
             'options': 0,
             'forex': 0,
-            'total': 0
+            'total': 0,
+            'by_asset_class': {}
         }
         
-        # Look for the Realized & Unrealized Performance Summary table (2021+ format)
         section_id = f"tblFIFOPerfSumByUnderlying{account_num}Body"
         pnl_section = soup.find('div', {'id': section_id})
         
         if pnl_section:
-            print(f"Found 2021+ P&L section for {account_num}")
-            rows = pnl_section.find_all('tr')
+            print(f"Found {label} P&L section for {account_num}")
+            matched = self.perf_summary.match_rows(pnl_section.find_all('tr'))
+            pnl_data['by_asset_class'] = matched
             
-            for row in rows:
-                row_classes = row.get('class', [])
-                if 'subtotal' in row_classes or 'total' in row_classes:
-                    cells = row.find_all('td')
-                    if len(cells) >= 7:
-                        first_cell = cells[0].get_text().strip()
-                        
-                        # Column 6 (index 6) contains realized total for 2021+ formats
-                        if 'Total Stocks' in first_cell:
-                            try:
-                                pnl_data['stocks'] = float(cells[6].get_text().replace(',', ''))
-                                print(f"  2021+: Stocks realized: {pnl_data['stocks']}")
-                            except Exception as e:
-                                print(f"  Error parsing stocks: {e}")
-                        
-                        elif 'Total Equity and Index Options' in first_cell:
-                            try:
-                                pnl_data['options'] = float(cells[6].get_text().replace(',', ''))
-                                print(f"  2021+: Options realized: {pnl_data['options']}")
-                            except Exception as e:
-                                print(f"  Error parsing options: {e}")
-                        
-                        elif 'Total Forex' in first_cell:
-                            try:
-                                pnl_data['forex'] = float(cells[6].get_text().replace(',', ''))
-                                print(f"  2021+: Forex realized: {pnl_data['forex']}")
-                            except Exception as e:
-                                print(f"  Error parsing forex: {e}")
-                        
-                        elif 'Total (All Assets)' in first_cell:
-                            try:
-                                pnl_data['total'] = float(cells[6].get_text().replace(',', ''))
-                                print(f"  2021+: Total realized: {pnl_data['total']}")
-                            except Exception as e:
-                                print(f"  Error parsing total: {e}")
+            for key, column in LEGACY_PNL_KEYS.items():
+                if 'Realized' in matched.get(column, {}):
+                    pnl_data[key] = matched[column]['Realized']
+                    print(f"  {label}: {column} realized: {pnl_data[key]}")
         else:
-            print(f"No 2021+ P&L section found for {account_num}")
+            print(f"No {label} P&L section found for {account_num}")
         
         return pnl_data
     
-    def extract_pnl_from_html(self, html_path):
+    def section_soup(self, statement, section_id):
+        """Parse a single section of a statement (None if absent)"""
+        html = statement.section_html(section_id)
+        if html is None:
+            return None
+        return BeautifulSoup(html, 'html.parser')
+    
+    def sniff_html_format(self, statement, summary_soup):
+        """Detect the format from the section index, decoding only the account summary"""
+        for section_id in statement.sections():
+            if section_id.startswith('tblFIFOPerfSumByUnderlying'):
+                return '2013'
+        return self.detect_html_format(summary_soup)
+    
+    def extract_pnl_from_html(self, html_path, statement=None):
         """Extract P&L data directly from HTML tables"""
+        if statement is None:
+            try:
+                with StatementBuffer.open(html_path) as statement:
+                    return self.extract_pnl_from_html(html_path, statement)
+            except OSError as e:
+                print(f"Error reading HTML {html_path}: {e}")
+                return []
+        
         try:
-            with open(html_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-                soup = BeautifulSoup(content, 'html.parser')
+            document_soup = None
+            summary_soup = self.section_soup(statement, 'tblAccountSummaryBody')
+            if summary_soup is None:
+                document_soup = BeautifulSoup(statement.decode(), 'html.parser')
+                summary_soup = document_soup
             
             # Detect format
-            format_type = self.detect_html_format(soup)
+            format_type = self.sniff_html_format(statement, summary_soup)
             print(f"Detected format: {format_type}")
             
             # Extract accounts
-            accounts = self.extract_accounts_from_html(soup)
+            accounts = self.extract_accounts_from_html(summary_soup)
+            if not accounts and document_soup is None:
+                # Account information sections live outside the summary
+                document_soup = BeautifulSoup(statement.decode(), 'html.parser')
+                accounts = self.extract_accounts_from_html(document_soup)
             print(f"Found HTML accounts: {accounts}")
             
             if not accounts:
@@ -205,12 +180,17 @@ class IBStatementExtractor:
                 account_num = account['account_number']
                 print(f"Looking for P&L data for {account_num}")
                 
+                section_id = f"tblFIFOPerfSumByUnderlying{account_num}Body"
+                pnl_soup = self.section_soup(statement, section_id)
+                if pnl_soup is None:
+                    pnl_soup = summary_soup
+                
                 # Use format-specific extraction
                 if format_type == '2013':
-                    pnl_data = self.extract_pnl_from_html_2013(soup, account_num)
+                    pnl_data = self.extract_pnl_from_html_2013(pnl_soup, account_num)
                 else:
                     # Use 2021+ format for 'new', 'old', and 'unknown' formats
-                    pnl_data = self.extract_pnl_from_html_2021(soup, account_num)
+                    pnl_data = self.extract_pnl_from_html_2021(pnl_soup, account_num)
                 
                 results.append({
                     'account': account_num,
@@ -224,6 +204,17 @@ class IBStatementExtractor:
             print(f"Error parsing HTML {html_path}: {e}")
             return []
     
+    def parse_statement_period_from_html(self, statement):
+        """Extract the statement period, decoding only the <title> when it has one"""
+        title = statement.title()
+        if title:
+            period = self.parse_statement_period(title)
+            if period[0]:
+                return period
+        
+        text = BeautifulSoup(statement.decode(), 'html.parser').get_text()
+        return self.parse_statement_period(text)
+    
     def parse_statement_period(self, text):
         """Extract the statement period from the text"""
         patterns = [
@@ -248,14 +239,23 @@ class IBStatementExtractor:
         print(f"Processing: {file_path}")
         
         if file_path.lower().endswith('.html'):
-            # Process HTML file
-            text = self.extract_text_from_html(file_path)
-            year, month, start_date, end_date = None, None, None, None
-            if text:
-                year, month, start_date, end_date = self.parse_statement_period(text)
+            # Process HTML file - mapped once, shared by the period and P&L readers
+            try:
+                statement = StatementBuffer.open(file_path)
+            except OSError as e:
+                print(f"Error reading HTML {file_path}: {e}")
+                return
             
-            # Extract P&L data from HTML tables
-            pnl_results = self.extract_pnl_from_html(file_path)
+            with statement:
+                self.perf_summary.set_source(os.path.basename(file_path))
+                year, month, start_date, end_date = self.parse_statement_period_from_html(statement)
+                
+                # Extract P&L data from HTML tables
+                pnl_results = self.extract_pnl_from_html(file_path, statement)
+                
+                # NAV, 2013 daily equity and position value series from the same section index
+                points = self.series.add_statement(statement)
+                print(f"  Collected {points} time-series points")
             
             if not pnl_results:
                 print(f"Could not extract P&L data from {file_path}")
@@ -274,6 +274,8 @@ class IBStatementExtractor:
                     'Forex_Realized': result['pnl_data']['forex'],
                     'Total_Realized': result['pnl_data']['total']
                 }
+                # Realized and unrealized totals for every asset class in the summary
+                row.update(pnl_row_values(result['pnl_data']['by_asset_class']))
                 
                 self.data.append(row)
                 print(f"  FINAL RESULT for {result['account']}: Realized P&L = {result['pnl_data']['total']}")
@@ -321,6 +323,16 @@ class IBStatementExtractor:
                 aggfunc='sum'
             ).reset_index()
             monthly_summary.to_excel(writer, sheet_name='Monthly_Summary', index=False)
+            
+            time_series = self.series.frame()
+            if not time_series.empty:
+                time_series.to_excel(writer, sheet_name='Time_Series', index=False)
+            
+            layout_warnings = self.perf_summary.layout_warnings()
+            if layout_warnings:
+                pd.DataFrame(layout_warnings, columns=LAYOUT_WARNING_COLUMNS).to_excel(
+                    writer, sheet_name='Layout_Warnings', index=False)
+                print(f"{len(layout_warnings)} unrecognised table layouts; see the Layout_Warnings sheet")
         
         print(f"Data saved to {output_path}")
         print(f"Processed {len(df)} account-month combinations")